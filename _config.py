@@ -8,6 +8,7 @@ from janitor.collector import (
     NetworkCollect,
 )
 from janitor.alarm.ram import RamAlert
+from janitor.alarm.window import WindowAlert
 from janitor.notification.mail import EmailNotification
 from janitor.notification.file import SimpleFileNotification
 
@@ -19,6 +20,47 @@ SQLITE_PATH = os.path.abspath(os.path.join(PROJECT_ROOT, SQLITE_FILE))
 
 INTERVAL = 55
 
+# collectors are run concurrently on COLLECT_THREADS threads, collection
+# taking longer than COLLECT_TIMEOUT seconds (or collector's 'timeout') is
+# skipped in that cycle
+COLLECT_THREADS = 4
+COLLECT_TIMEOUT = 10
+
+# count of collection cycles written to database in one transaction
+STORAGE_FLUSH_EVERY = 1
+
+# days of kept data, for raw collector tables and for each rollup tier (in
+# minutes), None keeps data forever; collectors can override it with
+# 'retention' keyword argument
+RETENTION = {
+    'raw': 2,
+    1: 7,
+    10: 90,
+    60: None,
+}
+
+# seconds between purges of data older than RETENTION
+RETENTION_INTERVAL = 60
+
+# file shared with data server, holding RING_BUFFER_HOURS of the latest
+# samples, recent charts and current values are read from it; None disables
+RING_BUFFER_PATH = os.path.join(PROJECT_ROOT, 'janitor.ring')
+RING_BUFFER_HOURS = 6
+
+# seconds between summary lines of daemon's own timings and counters, they
+# are also dumped to STATS_PATH and served by data server on /stats
+STATS_INTERVAL = 300
+STATS_PATH = os.path.join(PROJECT_ROOT, 'janitor.stats')
+
+# notifications are delivered by background thread, at most
+# NOTIFICATION_QUEUE_SIZE wait for delivery, newer ones are dropped; ones
+# arriving within NOTIFICATION_DIGEST_INTERVAL seconds are sent in one email;
+# failed delivery is retried NOTIFICATION_RETRIES times with growing delay
+NOTIFICATION_QUEUE_SIZE = 1000
+NOTIFICATION_DIGEST_INTERVAL = 30
+NOTIFICATION_RETRIES = 5
+
+# SMTP session is reused for notifications within 'keep_alive' seconds
 EMAIL_CONFIG = {
     'use_tls': True,
     'host': 'smtp.example.com',
@@ -34,13 +76,40 @@ file_notification = SimpleFileNotification(
     os.path.join(PROJECT_ROOT, 'log/alerts.log')
 )
 
-ram_alert = RamAlert([file_notification], 90)
+# alerts notify when they start firing and when they are resolved; they fire
+# after condition is met for 'duration' seconds, notify again every
+# 'cooldown' seconds while firing (never when None) and are resolved under
+# exit limit, so value around limit does not flap
+ram_alert = RamAlert([file_notification], 90, exit_limit=85, duration=120)
+# rules over recent samples of any series of collector (names as in
+# /api/current), evaluated in memory after every collection
+cpu_alert = WindowAlert(
+    [file_notification], '-1.usage', 90, 'count', window=5, count=3,
+    cooldown=60 * 60,
+)
 
+# each collector can set own 'interval' in seconds, INTERVAL is used otherwise
 COLLECTORS = {
-    'memory': (MemoryCollect, {'alerts': [ram_alert]}),
-    'cpu_load': (CPULoadCollect, {}),
+    'memory': (MemoryCollect, {'alerts': [ram_alert], 'interval': 60}),
+    # chart shows total and at most 'chart_cores' of the busiest cores
+    'cpu_load': (CPULoadCollect, {
+        'alerts': [cpu_alert], 'interval': 5, 'chart_cores': 16,
+    }),
     'load_average': (LoadAverageCollect, {}),
-    'network_wlan0': (NetworkCollect, {'interface': 'wlan0'}),
+    # all interfaces are collected in one pass, 'include' and 'exclude' take
+    # glob patterns of interface names, chart shows 'chart_interfaces' of
+    # the busiest ones
+    'network': (NetworkCollect, {'exclude': ['lo'], 'chart_interfaces': 5}),
 }
 
 JANITOR_DATA_BIND_TO = ('', 9999)
+# count of threads serving dashboard, each one keeps its own connection
+JANITOR_DATA_THREADS = 8
+# seconds an idle keep-alive connection is kept open, it does not hold thread
+JANITOR_DATA_KEEP_ALIVE = 15
+# rows of every chart sent to browser, longer data are downsampled
+CHART_POINTS = 1000
+# count of chart results kept by data server, they are updated incrementally
+JANITOR_DATA_CACHE_SIZE = 32
+# seconds between checks for new data pushed to open dashboards
+JANITOR_DATA_EVENTS_INTERVAL = 5
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+Compare janitor.utils.json_dumps with the regex based serializer used before,
+on chart data of given count of rows. Cold column is json_dumps without
+dates formatted by previous calls, as in the first render of a chart.
+
+usage: bench_json.py [rows] [count]
+"""
+import json
+import os
+import random
+import re
+import sys
+import timeit
+from datetime import datetime, date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from janitor import utils
+from janitor.utils import json_dumps, json_iterdumps
+
+
+class LegacyJSONDateEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, datetime):
+            return '**new Date(%i,%i,%i,%i,%i,%i)' % (
+                obj.year, obj.month-1, obj.day,
+                obj.hour, obj.minute, obj.second,
+            )
+        if isinstance(obj, date):
+            return '**new Date(%i,%i,%i)' % (obj.year, obj.month-1, obj.day)
+        return json.JSONEncoder.default(self, obj)
+
+
+def legacy_json_dumps(obj):
+    __jsdateregexp__ = re.compile(r'"\*\*(new Date\([0-9,]+\))"')
+    out = __jsdateregexp__.sub(
+        r'\1', json.dumps(obj, cls=LegacyJSONDateEncoder),
+    )
+    return unicode(out).decode('utf-8')
+
+
+def get_rows(count, columns):
+    start = datetime(2015, 1, 1)
+
+    return [
+        [start + timedelta(minutes=10 * index)] + [
+            round(random.random() * 100, 2) for _ in xrange(columns)
+        ]
+        for index in xrange(count)
+    ]
+
+
+def run(rows, count):
+    print '%-24s %12s %12s %12s %12s %8s' % (
+        'payload', 'legacy [ms]', 'cold [ms]', 'dumps [ms]', 'iter [ms]',
+        'ratio',
+    )
+
+    for columns in (3, 6, 17):
+        data = get_rows(rows, columns)
+
+        # the same JS, except whitespace legacy put after separators
+        assert json_dumps(data) == legacy_json_dumps(data).replace(', ', ',')
+        assert json_dumps(data) == ''.join(json_iterdumps(data))
+
+        legacy_time = min(timeit.repeat(
+            lambda: legacy_json_dumps(data), number=count, repeat=3,
+        ))
+        # without formatted dates from previous calls
+        cold_time = min(timeit.repeat(
+            lambda: json_dumps(data), utils.__js_dates__.clear,
+            number=1, repeat=count,
+        )) * count
+        dumps_time = min(timeit.repeat(
+            lambda: json_dumps(data), number=count, repeat=3,
+        ))
+        iter_time = min(timeit.repeat(
+            lambda: list(json_iterdumps(data)), number=count, repeat=3,
+        ))
+
+        print '%-24s %12.2f %12.2f %12.2f %12.2f %8.2f' % (
+            '%i rows x %i columns' % (rows, columns),
+            legacy_time / count * 1e3,
+            cold_time / count * 1e3,
+            dumps_time / count * 1e3,
+            iter_time / count * 1e3,
+            legacy_time / dumps_time,
+        )
+
+
+if __name__ == '__main__':
+    run(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 4320,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 20,
+    )
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+Compare cost of one sample read with janitor.procfs readers against the way
+collectors parsed /proc before. Recorded files of benchmarks/fixtures/proc
+are read by default, so results do not depend on host.
+
+usage: bench_procfs.py [count] [proc root]
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from janitor import procfs
+
+LA_PATTERN = '(?P<la1>\d+\.\d+) (?P<la5>\d+\.\d+) (?P<la15>\d+\.\d+) .*'
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'fixtures', 'proc')
+
+
+def legacy_stat(proc_stat_fd):
+    proc_stat_fd.seek(0)
+    cpu_times = {}
+
+    for line in proc_stat_fd.readlines():
+        if not line.startswith('cpu'):
+            continue
+
+        columns = line.split(' ')
+        cpu_times[columns[0]] = map(int, filter(None, columns[1:]))
+
+    proc_stat_fd.seek(0)
+    sum(tuple(
+        1
+        for line in proc_stat_fd.readlines()
+        if re.match('cpu\d+.*', line)
+    ))
+
+    return cpu_times
+
+
+def legacy_meminfo(path):
+    swap_total = swap_free = mem_total = mem_free = \
+        mem_buffers = mem_cache = None
+
+    with open(path, 'r') as f:
+        for line in f:
+            if line.startswith('SwapTotal:'):
+                swap_total = int(line.split()[1])
+            elif line.startswith('SwapFree:'):
+                swap_free = int(line.split()[1])
+            elif line.startswith('MemTotal:'):
+                mem_total = int(line.split()[1])
+            elif line.startswith('MemFree:'):
+                mem_free = int(line.split()[1])
+            elif line.startswith('Cached:'):
+                mem_cache = int(line.split()[1])
+            elif line.startswith('Buffers:'):
+                mem_buffers = int(line.split()[1])
+
+            have_values = all((
+                mem_total, mem_free, mem_buffers,
+                mem_cache, swap_total, swap_free,
+            ))
+            if have_values:
+                break
+
+    return swap_total, swap_free, mem_total, mem_free, mem_buffers, mem_cache
+
+
+def legacy_loadavg(path):
+    with open(path, 'r') as fh:
+        la_dict = re.match(LA_PATTERN, fh.read()).groupdict()
+
+    return float(la_dict['la1']), \
+        float(la_dict['la5']), \
+        float(la_dict['la15'])
+
+
+def legacy_net_dev(network_stats_fd):
+    # the same parsing per line, for all interfaces like NetworkCollect
+    network_stats_fd.seek(0)
+    stats = {}
+    for line in network_stats_fd.readlines()[2:]:
+        line = line.split(':')
+        counters = line[1].split()
+        stats[line[0].strip()] = {
+            'rx_bytes': int(counters[0]),
+            'tx_bytes': int(counters[8]),
+            'rx_packets': int(counters[1]),
+            'tx_packets': int(counters[9]),
+        }
+    return stats
+
+
+def run(count, root=FIXTURES):
+    stat = procfs.StatReader(root)
+    meminfo = procfs.MeminfoReader(root)
+    loadavg = procfs.LoadavgReader(root)
+    net_dev = procfs.NetDevReader(root)
+    proc_stat_fd = open(os.path.join(root, 'stat'), 'r')
+    network_stats_fd = open(os.path.join(root, 'net/dev'), 'r')
+
+    cases = (
+        ('/proc/stat', lambda: legacy_stat(proc_stat_fd), stat.read),
+        ('/proc/meminfo',
+         lambda: legacy_meminfo(os.path.join(root, 'meminfo')),
+         meminfo.read),
+        ('/proc/loadavg',
+         lambda: legacy_loadavg(os.path.join(root, 'loadavg')),
+         loadavg.read),
+        ('/proc/net/dev', lambda: legacy_net_dev(network_stats_fd),
+         net_dev.read),
+    )
+
+    print '%-16s %12s %12s %8s' % (
+        'file', 'legacy [us]', 'procfs [us]', 'ratio',
+    )
+    for name, legacy, reader in cases:
+        legacy_time = min(timeit.repeat(legacy, number=count, repeat=3))
+        reader_time = min(timeit.repeat(reader, number=count, repeat=3))
+
+        print '%-16s %12.2f %12.2f %8.2f' % (
+            name,
+            legacy_time / count * 1e6,
+            reader_time / count * 1e6,
+            legacy_time / reader_time,
+        )
+
+    for reader in (stat, meminfo, loadavg, net_dev):
+        reader.close()
+    proc_stat_fd.close()
+    network_stats_fd.close()
+
+
+if __name__ == '__main__':
+    run(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 10000,
+        sys.argv[2] if len(sys.argv) > 2 else FIXTURES,
+    )
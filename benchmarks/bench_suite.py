@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+Benchmarks of collection, storage and dashboard, runnable without real host
+
+* collect() of every collector, reading recorded /proc files from
+  benchmarks/fixtures/proc
+* flush of collected samples into SQLite (rows per second)
+* get_data() of every collector against synthetic databases of given days
+  of samples (janitor.synthetic), they are generated once and kept in data
+  directory
+* json_dumps of chart data and render of whole dashboard page, without and
+  with data cache
+
+Results are printed and written as JSON, so runs can be compared.
+
+usage: bench_suite.py [-h] [--days DAYS] [--interval SECONDS] [--repeat N]
+                      [--data-dir DIR] [--output FILE]
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import types
+from collections import OrderedDict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from janitor.cache import DataCache
+from janitor.collector import (
+    MemoryCollect,
+    CPULoadCollect,
+    LoadAverageCollect,
+    NetworkCollect,
+)
+from janitor.storage import connect, Storage
+from janitor.synthetic import generate
+from janitor.utils import json_dumps
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'fixtures', 'proc')
+
+COLLECTORS = OrderedDict((
+    ('memory', (MemoryCollect, {'proc_root': FIXTURES})),
+    ('cpu_load', (CPULoadCollect, {
+        'proc_root': FIXTURES, 'chart_cores': 16,
+    })),
+    ('load_average', (LoadAverageCollect, {'proc_root': FIXTURES})),
+    ('network', (NetworkCollect, {
+        'proc_root': FIXTURES, 'exclude': ['lo'],
+    })),
+))
+
+
+def get_collectors(connection, storage=None):
+    return [
+        collector(connection, storage=storage, **kwargs)
+        for collector, kwargs in COLLECTORS.values()
+    ]
+
+
+def close(collectors):
+    for collector in collectors:
+        collector.close()
+
+
+def install(collectors):
+    for collector in collectors:
+        if not collector.is_installed():
+            collector.install()
+        if not collector.is_rollup_installed():
+            collector.install_rollup()
+
+
+def measure(func, number=1, repeat=3, setup='pass'):
+    """
+    Return best and mean seconds of one call of func
+    """
+    times = [
+        total / number
+        for total in timeit.repeat(func, setup, number=number, repeat=repeat)
+    ]
+
+    return OrderedDict((
+        ('best', min(times)),
+        ('mean', sum(times) / len(times)),
+        ('number', number),
+        ('repeat', repeat),
+    ))
+
+
+def get_database(data_dir, days, interval):
+    """
+    Return path of synthetic database, created when it does not exist yet
+    """
+    path = os.path.join(data_dir, 'janitor-%id-%is.db' % (days, interval))
+
+    if not os.path.exists(path):
+        print 'generating %i days of samples into %s' % (days, path)
+        connection = sqlite3.connect(path + '.tmp')
+        # cores and interfaces of recorded /proc files
+        generate(
+            connection, days, interval, cores=8, interfaces=7, seed=0,
+            proc_root=FIXTURES,
+        )
+        connection.close()
+        os.rename(path + '.tmp', path)
+
+    return path
+
+
+def bench_collect(results, repeat):
+    connection = connect(':memory:')
+    storage = Storage(connection)
+
+    for collector in get_collectors(connection, storage):
+        install([collector])
+        results['collect.%s' % collector.table_name] = measure(
+            collector.collect, 1000, repeat,
+        )
+        storage.flush()
+        collector.close()
+
+
+def bench_insert(results, data_dir, repeat, cycles=100):
+    path = os.path.join(data_dir, 'janitor-insert.db')
+    if os.path.exists(path):
+        os.remove(path)
+
+    connection = connect(path)
+    storage = Storage(connection)
+    collectors = get_collectors(connection, storage)
+    install(collectors)
+
+    def fill():
+        for _ in xrange(cycles):
+            for collector in collectors:
+                collector.collect()
+
+    fill()
+    rows = sum(len(params) for params in storage.pending.values())
+    storage.flush()
+
+    result = measure(storage.flush, 1, repeat, fill)
+    result['rows'] = rows
+    result['rows_per_second'] = rows / result['best']
+    results['storage.flush'] = result
+
+    close(collectors)
+    connection.close()
+    os.remove(path)
+
+
+def bench_get_data(results, path, days, repeat):
+    connection = connect(path)
+    collectors = get_collectors(connection)
+
+    for collector in collectors:
+        results['get_data.%s.%id' % (collector.table_name, days)] = measure(
+            lambda: collector.get_data(30, 10), 1, repeat,
+        )
+
+    close(collectors)
+    connection.close()
+
+
+def bench_json(results, path, repeat):
+    connection = connect(path)
+    collector = CPULoadCollect(connection, **COLLECTORS['cpu_load'][1])
+    data = collector.get_data(30, 10)
+
+    result = measure(lambda: json_dumps(data), 10, repeat)
+    result['rows'] = len(data)
+    results['json_dumps.cpu_usage'] = result
+
+    collector.close()
+    connection.close()
+
+
+def bench_page(results, path, repeat):
+    # data server reads its settings from config module
+    config = types.ModuleType('config')
+    config.SQLITE_PATH = path
+    config.COLLECTORS = COLLECTORS
+    config.RING_BUFFER_PATH = None
+    sys.modules['config'] = config
+
+    from janitor.web import ChartHandler, Worker
+
+    class PageServer(object):
+        local = threading.local()
+        cache = None
+
+    class PageHandler(ChartHandler):
+        # renders page without any connection
+        def __init__(self, server):
+            self.server = server
+
+    server = PageServer()
+    server.local.worker = Worker()
+    handler = PageHandler(server)
+
+    def cold():
+        server.cache = DataCache()
+        handler.render_page()
+
+    results['page.render.cold'] = measure(cold, 1, repeat)
+
+    server.cache = DataCache()
+    handler.render_page()
+    results['page.render.cached'] = measure(handler.render_page, 1, repeat)
+
+
+def print_results(results):
+    print '%-40s %12s %12s' % ('benchmark', 'best [ms]', 'mean [ms]')
+
+    for name, result in results.items():
+        print '%-40s %12.3f %12.3f%s' % (
+            name, result['best'] * 1e3, result['mean'] * 1e3,
+            '   %.0f rows/s' % result['rows_per_second']
+            if 'rows_per_second' in result else '',
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--days', default='1,30,365',
+        help='comma separated days of synthetic databases (default: '
+             '%(default)s)',
+    )
+    parser.add_argument(
+        '--interval', type=int, default=55,
+        help='seconds between synthetic samples (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--repeat', type=int, default=5,
+        help='repetitions of every benchmark (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--data-dir',
+        default=os.path.join(tempfile.gettempdir(), 'janitor-bench'),
+        help='directory of synthetic databases (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--output', default='bench_results.json',
+        help='JSON file with results (default: %(default)s)',
+    )
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.data_dir):
+        os.makedirs(args.data_dir)
+
+    days = [int(value) for value in args.days.split(',')]
+    databases = OrderedDict(
+        (day, get_database(args.data_dir, day, args.interval))
+        for day in days
+    )
+
+    results = OrderedDict()
+    bench_collect(results, args.repeat)
+    bench_insert(results, args.data_dir, args.repeat)
+    for day, path in databases.items():
+        bench_get_data(results, path, day, args.repeat)
+
+    # dashboard shows 30 days, the closest database is used
+    path = databases[min(days, key=lambda day: abs(day - 30))]
+    bench_json(results, path, args.repeat)
+    bench_page(results, path, args.repeat)
+
+    print_results(results)
+
+    with open(args.output, 'w') as output:
+        json.dump(OrderedDict((
+            ('timestamp', int(time.time())),
+            ('python', platform.python_version()),
+            ('platform', platform.platform()),
+            ('interval', args.interval),
+            ('results', results),
+        )), output, indent=2)
+
+    print 'results written to %s' % args.output
+
+
+if __name__ == '__main__':
+    main()
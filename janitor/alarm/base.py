@@ -1,10 +1,27 @@
 # -*- coding:utf-8 -*-
 from abc import abstractmethod, ABCMeta
 
+from janitor.utils import monotonic
+
+# states of alert, condition is checked after every collection:
+# OK - condition is not met
+# PENDING - condition is met shorter than duration of alert
+# FIRING - condition is met for duration, notifiers were called
+# RESOLVED - condition stopped being met while firing, notifiers were called
+OK = 'ok'
+PENDING = 'pending'
+FIRING = 'firing'
+RESOLVED = 'resolved'
+
 
 class BaseAlert(object):
     """
     Abstract alert class
+
+    Notifiers are called only when alert starts firing, when it is resolved
+    and, with cooldown set, every cooldown seconds while it keeps firing.
+    Subclasses with thresholds should use exit threshold while alert is
+    ``active``, so value oscillating around threshold does not flap.
     """
 
     __metaclass__ = ABCMeta
@@ -15,22 +32,99 @@ class BaseAlert(object):
 
     notifers = None
 
-    def __init__(self, notifers):
+    # janitor.notification.dispatcher.Dispatcher delivering notifications,
+    # set by daemon; notifiers are called directly without it
+    dispatcher = None
+
+    def __init__(self, notifers, duration=0, cooldown=None):
+        """
+        :param duration: Seconds condition has to be met before alert fires
+        :type duration: float
+        :param cooldown: Seconds after which firing alert notifies again,
+            None notifies only once
+        :type cooldown: float
+        """
         self.notifers = notifers or []
+        self.duration = duration
+        self.cooldown = cooldown
+        self.state = OK
+        # monotonic time when condition started to be met
+        self.pending_since = None
+        # monotonic time of the last notification about firing
+        self.notified_at = None
+
+    @property
+    def active(self):
+        """
+        Whether condition was met at last check
+        """
+        return self.state in (PENDING, FIRING)
 
     @abstractmethod
     def _check(self, collector):
         pass
 
+    def inherit(self, previous):
+        """
+        Take over state of alert it replaces after reload of config, so
+        firing alert does not notify again
+
+        :type previous: BaseAlert
+        """
+        self.state = previous.state
+        self.pending_since = previous.pending_since
+        self.notified_at = previous.notified_at
+
+    def notify(self, message):
+        for notifer in self.notifers:
+            if self.dispatcher is not None:
+                self.dispatcher.submit(notifer, self, message)
+            else:
+                notifer.send_notification(self, message)
+
+    def transition(self, met, now=None):
+        """
+        Move alert to next state by result of condition and notify about
+        firing and resolving
+
+        :param met: Whether condition is met now
+        :type met: bool
+        :return: New state
+        :rtype: str
+        """
+        now = monotonic() if now is None else now
+
+        if met:
+            if not self.active:
+                self.state = PENDING
+                self.pending_since = now
+
+            if self.state == PENDING and \
+                    now - self.pending_since >= self.duration:
+                self.state = FIRING
+                self.notified_at = now
+                self.notify(self.message)
+            elif self.state == FIRING and self.cooldown is not None and \
+                    now - self.notified_at >= self.cooldown:
+                self.notified_at = now
+                self.notify(self.message)
+        elif self.state == FIRING:
+            self.state = RESOLVED
+            self.notify('Resolved: %s' % self.message)
+        else:
+            self.state = OK
+
+        return self.state
+
     def check(self, collector):
         """
-        Check if conditions are meet, and fire alert
+        Check if conditions are meet, and notify about changes of state
+
         :param collector: Given collector
         :type collector: collector.base.BaseCollector
-        :return: Do fire alert?
+        :return: Is alert firing?
         :rtype: bool
         """
         self.collector = collector
-        if self._check(collector):
-            for notifer in self.notifers:
-                notifer.send_notification(self, self.message)
+
+        return self.transition(bool(self._check(collector))) == FIRING
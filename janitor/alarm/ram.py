@@ -7,18 +7,27 @@ class RamAlert(BaseAlert):
     def message(self):
         return 'Ram usage exceed %d%%' % self.percentage_limit
 
-    def __init__(self, notifers, percentage_limit=90):
+    def __init__(self, notifers, percentage_limit=90, exit_limit=None,
+                 **kwargs):
+        """
+        :param exit_limit: Percentage under which firing alert is resolved,
+            percentage_limit by default
+        :type exit_limit: float
+        """
         self.percentage_limit = percentage_limit
-        super(RamAlert, self).__init__(notifers)
+        self.exit_limit = percentage_limit if exit_limit is None \
+            else exit_limit
+        super(RamAlert, self).__init__(notifers, **kwargs)
 
     def _check(self, collector):
+        limit = self.exit_limit if self.active else self.percentage_limit
 
         used_ram = collector.last_reading[2] - (
             collector.last_reading[3] +  # free mem
             collector.last_reading[4] +  # buffers
             collector.last_reading[5]  # cache
         )
-        if used_ram >= (self.percentage_limit/100) * collector.last_reading[2]:
+        if used_ram >= (limit / 100.0) * collector.last_reading[2]:
             return True
 
         return False
@@ -0,0 +1,393 @@
+# -*- coding:utf-8 -*-
+"""
+Alerts evaluated over sliding window of recent samples
+
+Samples come from collector.get_last_sample() after every collection, so
+rules never touch database. Every window keeps its state incrementally:
+running sum for mean, monotonic queues for min and max, count of samples
+matching the rule and logarithmic sketch for percentiles. Adding a sample
+and dropping the oldest one cost O(1) (amortized for min and max).
+"""
+import math
+import operator
+from collections import deque
+from fnmatch import fnmatchcase
+
+from janitor.alarm.base import BaseAlert
+
+OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+}
+
+AGGREGATES = ('last', 'mean', 'min', 'max', 'percentile', 'count')
+
+
+class Sketch(object):
+    """
+    Approximate distribution of values, quantiles are within relative
+    ``accuracy`` of exact ones. Values are counted in logarithmic buckets,
+    so adding and removing value is O(1) and size does not depend on count
+    of values.
+    """
+
+    def __init__(self, accuracy=0.01):
+        """
+        :param accuracy: Relative error of returned quantiles
+        :type accuracy: float
+        """
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        # counts of positive values and of negated negative values by bucket
+        self.positive = {}
+        self.negative = {}
+        self.zero = 0
+        self.count = 0
+
+    def get_bucket(self, value):
+        return int(math.ceil(math.log(value) / self.log_gamma))
+
+    def get_value(self, bucket):
+        return 2 * self.gamma ** bucket / (self.gamma + 1)
+
+    def update(self, value, change):
+        self.count += change
+
+        if value > 0:
+            buckets = self.positive
+        elif value < 0:
+            buckets = self.negative
+            value = -value
+        else:
+            self.zero += change
+            return
+
+        bucket = self.get_bucket(value)
+        count = buckets.get(bucket, 0) + change
+        if count:
+            buckets[bucket] = count
+        else:
+            del buckets[bucket]
+
+    def add(self, value):
+        self.update(value, 1)
+
+    def remove(self, value):
+        self.update(value, -1)
+
+    def quantile(self, q):
+        """
+        Return approximate value at quantile q (0 to 1), None when empty
+        """
+        if not self.count:
+            return None
+
+        rank = int(q * (self.count - 1))
+
+        for bucket in sorted(self.negative, reverse=True):
+            rank -= self.negative[bucket]
+            if rank < 0:
+                return -self.get_value(bucket)
+
+        rank -= self.zero
+        if rank < 0:
+            return 0.0
+
+        for bucket in sorted(self.positive):
+            rank -= self.positive[bucket]
+            if rank < 0:
+                return self.get_value(bucket)
+
+        return self.get_value(max(self.positive))
+
+
+class SlidingWindow(object):
+    """
+    Last ``size`` samples of one series, or samples of last ``seconds``
+    """
+
+    def __init__(self, size=None, seconds=None, predicate=None,
+                 accuracy=0.01):
+        """
+        :param size: Max count of samples
+        :type size: int
+        :param seconds: Max age of samples relative to the latest one
+        :type seconds: float
+        :param predicate: Function of value, samples for which it is true are
+            counted in ``matching``
+        :type predicate: callable
+        :param accuracy: Relative accuracy of percentiles
+        :type accuracy: float
+        """
+        if size is None and seconds is None:
+            raise ValueError('Window needs size or seconds')
+
+        self.size = size
+        self.seconds = seconds
+        self.predicate = predicate
+        self.samples = deque()
+        # candidates for min and max, as (sequence, value) pairs
+        self.minima = deque()
+        self.maxima = deque()
+        self.sketch = Sketch(accuracy)
+        self.total = 0.0
+        self.matching = 0
+        self.sequence = 0
+
+    def __len__(self):
+        return len(self.samples)
+
+    def append(self, timestamp, value):
+        """
+        Add sample and drop samples falling out of window
+        """
+        self.sequence += 1
+        self.samples.append((self.sequence, timestamp, value))
+        self.total += value
+        self.sketch.add(value)
+        if self.predicate is not None and self.predicate(value):
+            self.matching += 1
+
+        while self.minima and self.minima[-1][1] >= value:
+            self.minima.pop()
+        self.minima.append((self.sequence, value))
+
+        while self.maxima and self.maxima[-1][1] <= value:
+            self.maxima.pop()
+        self.maxima.append((self.sequence, value))
+
+        while self.samples and (
+            (self.size is not None and len(self.samples) > self.size) or
+            (self.seconds is not None and
+             self.samples[0][1] <= timestamp - self.seconds)
+        ):
+            self.evict()
+
+    def evict(self):
+        sequence, _, value = self.samples.popleft()
+        self.total -= value
+        self.sketch.remove(value)
+        if self.predicate is not None and self.predicate(value):
+            self.matching -= 1
+
+        if self.minima[0][0] == sequence:
+            self.minima.popleft()
+        if self.maxima[0][0] == sequence:
+            self.maxima.popleft()
+
+        if not self.samples:
+            # rounding errors of running sum do not survive empty window
+            self.total = 0.0
+
+    @property
+    def last(self):
+        return self.samples[-1][2] if self.samples else None
+
+    @property
+    def mean(self):
+        if not self.samples:
+            return None
+
+        return self.total / len(self.samples)
+
+    @property
+    def min(self):
+        return self.minima[0][1] if self.minima else None
+
+    @property
+    def max(self):
+        return self.maxima[0][1] if self.maxima else None
+
+    def percentile(self, percent):
+        return self.sketch.quantile(percent / 100.0)
+
+
+class WindowAlert(BaseAlert):
+    """
+    Alert on aggregate of recent samples of collector series
+
+    ``series`` is name of series as in collector.get_series_names(), e.g.
+    'swap_used' or 'eth0.rx_bytes', or glob pattern like '*.usage'. Every
+    matching series has its own window and alert fires when any of them
+    meets the rule. Aggregates:
+
+    * ``last``, ``mean``, ``min``, ``max`` of window compared to threshold
+    * ``percentile`` of window (see ``percentile``) compared to threshold
+    * ``count`` - at least ``count`` samples of window compared to
+      threshold are true, e.g. 3 of last 5 samples above 90
+    """
+
+    def __init__(self, notifers, series, threshold, aggregate='mean',
+                 comparison='>', window=5, seconds=None, percentile=95,
+                 count=None, min_samples=None, exit_threshold=None,
+                 **kwargs):
+        """
+        :param series: Name or glob pattern of series
+        :type series: str
+        :param threshold: Value aggregate is compared with
+        :type threshold: float
+        :param aggregate: One of AGGREGATES
+        :type aggregate: str
+        :param comparison: One of OPERATORS, aggregate comparison threshold
+        :type comparison: str
+        :param window: Count of samples in window
+        :type window: int
+        :param seconds: Window of samples of that many last seconds instead
+        :type seconds: float
+        :param percentile: Percentile for 'percentile' aggregate
+        :type percentile: float
+        :param count: Samples needed for 'count' aggregate, whole window by
+            default
+        :type count: int
+        :param min_samples: Count of samples window must have before rule is
+            evaluated, full window (or one sample for time window) by default
+        :type min_samples: int
+        :param exit_threshold: Threshold of firing alert, it is resolved
+            when aggregate does not meet it; threshold by default. 'count'
+            aggregate always counts samples meeting threshold.
+        :type exit_threshold: float
+        """
+        if aggregate not in AGGREGATES:
+            raise ValueError('Unknown aggregate %r' % aggregate)
+
+        self.series = series
+        self.threshold = threshold
+        self.exit_threshold = threshold if exit_threshold is None \
+            else exit_threshold
+        self.aggregate = aggregate
+        self.comparison = comparison
+        self.compare = OPERATORS[comparison]
+        self.size = None if seconds is not None else window
+        self.seconds = seconds
+        self.percentile = percentile
+        self.count = count if count is not None else window
+        if min_samples is None:
+            min_samples = self.size or 1
+        self.min_samples = min_samples
+        self.windows = {}
+        self.last_timestamp = None
+        self.message = None
+        super(WindowAlert, self).__init__(notifers, **kwargs)
+
+    def __str__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.series)
+
+    def inherit(self, previous):
+        """
+        Take over state and also windows of previous alert, when they hold
+        the same samples
+        """
+        super(WindowAlert, self).inherit(previous)
+        self.message = previous.message
+
+        for name in ('series', 'size', 'seconds', 'threshold', 'comparison'):
+            if getattr(self, name) != getattr(previous, name):
+                # windows of other rule, they are filled again
+                return
+
+        predicate = self.get_predicate()
+        for window in previous.windows.itervalues():
+            window.predicate = predicate
+
+        self.windows = previous.windows
+        self.last_timestamp = previous.last_timestamp
+
+    def get_predicate(self):
+        return lambda value: self.compare(value, self.threshold)
+
+    def get_window(self, name):
+        window = self.windows.get(name)
+
+        if window is None:
+            window = self.windows[name] = SlidingWindow(
+                self.size, self.seconds, self.get_predicate(),
+            )
+
+        return window
+
+    def update(self, collector):
+        """
+        Add the latest sample of collector to windows of matching series.
+        Windows of series missing in the sample (e.g. removed interface) are
+        dropped, so they do not keep firing on old values.
+
+        :return: False when there was no new sample
+        :rtype: bool
+        """
+        sample = collector.get_last_sample()
+        if sample is None or sample[0] == self.last_timestamp:
+            return False
+
+        timestamp, values = sample
+        self.last_timestamp = timestamp
+        matched = set()
+
+        for name, value in values.iteritems():
+            if fnmatchcase(name, self.series):
+                matched.add(name)
+                if value is not None:
+                    self.get_window(name).append(timestamp, value)
+
+        for name in self.windows.keys():
+            if name not in matched:
+                del self.windows[name]
+
+        return True
+
+    def get_value(self, window):
+        """
+        Return aggregate of window, compared to threshold
+        """
+        if self.aggregate == 'percentile':
+            return window.percentile(self.percentile)
+        elif self.aggregate == 'count':
+            return window.matching
+
+        return getattr(window, self.aggregate)
+
+    def is_met(self, window):
+        if len(window) < self.min_samples:
+            return False
+
+        if self.aggregate == 'count':
+            return window.matching >= self.count
+
+        return self.compare(
+            self.get_value(window),
+            self.exit_threshold if self.active else self.threshold,
+        )
+
+    def _check(self, collector):
+        if not self.update(collector):
+            # nothing new to evaluate, condition stays as it was
+            return self.active
+
+        met = [
+            (name, self.get_value(window))
+            for name, window in sorted(self.windows.items())
+            if self.is_met(window)
+        ]
+        if not met:
+            return False
+
+        if self.aggregate == 'count':
+            rule = '%i of window samples %s %s' % (
+                self.count, self.comparison, self.threshold,
+            )
+        else:
+            rule = '%s %s %s' % (
+                self.aggregate if self.aggregate != 'percentile'
+                else 'p%s' % self.percentile,
+                self.comparison,
+                self.exit_threshold if self.active else self.threshold,
+            )
+
+        self.message = '%s %s: %s' % (
+            collector.table_name, rule, ', '.join(
+                '%s=%s' % (name, round(value, 2)) for name, value in met
+            ),
+        )
+
+        return True
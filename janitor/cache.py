@@ -0,0 +1,101 @@
+# -*- coding:utf-8 -*-
+"""
+Cache of data fetched by collectors for charts
+
+Result of get_data() is kept per collector, limit and interval. Entry is
+valid while id of the latest row of collector table stays the same. When
+new rows appear, only buckets since the last cached one are fetched and
+merged into cached result, so repeated views cost one range query on index.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+
+class CacheEntry(object):
+    def __init__(self, last_id, rows, shown_keys):
+        """
+        :param last_id: Id of the latest row, when rows were fetched
+        :type last_id: int
+        :param rows: Result of get_data()
+        :type rows: list
+        :param shown_keys: Series chosen by collector for rows
+        :type shown_keys: list
+        """
+        self.last_id = last_id
+        self.rows = rows
+        self.shown_keys = shown_keys
+
+
+class DataCache(object):
+    """
+    LRU cache of get_data() results, shared by threads of data server
+    """
+
+    def __init__(self, size=32):
+        """
+        :param size: Max count of cached results
+        :type size: int
+        """
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_data(self, collector, limit=30, interval=10):
+        """
+        Return the same as collector.get_data(limit, interval)
+
+        :type collector: janitor.collector.base.BaseCollect
+        """
+        key = (collector.table_name, limit, interval)
+        last_id = collector.get_last_id()
+
+        with self.lock:
+            entry = self.entries.pop(key, None)
+
+        if entry is None or not entry.rows or last_id is None or \
+                entry.last_id > last_id:
+            # not cached yet, nothing to merge with, or table was replaced
+            rows = collector.get_data(limit, interval)
+        else:
+            collector.shown_keys = entry.shown_keys
+            rows = entry.rows
+            if entry.last_id != last_id:
+                rows = self.merge(collector, rows, limit, interval)
+            rows = self.trim(collector, rows, limit, interval)
+
+        with self.lock:
+            self.entries[key] = CacheEntry(
+                last_id, rows, collector.shown_keys,
+            )
+
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+        return rows
+
+    def merge(self, collector, rows, limit, interval):
+        """
+        Return cached rows merged with buckets since the last cached one
+        """
+        # the last cached bucket was probably not complete yet, its rows are
+        # fetched again
+        since = int(time.mktime(rows[-1][0].timetuple())) - interval * 60
+        since_datetime = datetime.fromtimestamp(since)
+
+        return [row for row in rows if row[0] < since_datetime] + \
+            collector.get_data(limit, interval, since)
+
+    def trim(self, collector, rows, limit, interval):
+        """
+        Return rows without the ones older than limit
+        """
+        start = datetime.fromtimestamp(
+            collector.get_limit_timestamp(limit) - interval * 60
+        )
+
+        if rows and rows[0][0] < start:
+            rows = [row for row in rows if row[0] >= start]
+
+        return rows
@@ -0,0 +1,140 @@
+# -*- coding:utf-8 -*-
+"""
+Downsampling of chart data
+
+Series are reduced with Largest-Triangle-Three-Buckets algorithm (Sveinn
+Steinarsson, 2013), which keeps visual shape of series, including its peaks,
+from much smaller count of points. Series of one chart share x axis, so rows
+are chosen for all of them at once and chart gets at most given count of
+rows, no matter how many series it has.
+"""
+import calendar
+from datetime import datetime
+
+# default count of points per series sent to chart, about its width in pixels
+DEFAULT_POINTS = 1000
+
+
+def get_x(value):
+    """
+    Return numeric x coordinate of datetime or number
+    """
+    if isinstance(value, datetime):
+        return calendar.timegm(value.timetuple())
+
+    return value
+
+
+def lttb(xs, ys, threshold):
+    """
+    Return indexes of points chosen by Largest-Triangle-Three-Buckets
+
+    :param xs: X coordinates, ascending
+    :type xs: list
+    :param ys: Y coordinates
+    :type ys: list
+    :param threshold: Count of chosen points
+    :type threshold: int
+    :rtype: list
+    """
+    return lttb_rows(xs, [ys], threshold)
+
+
+def lttb_rows(xs, columns, threshold):
+    """
+    Return indexes of rows chosen by Largest-Triangle-Three-Buckets from
+    more series sharing x coordinates. In every bucket the row forming the
+    largest triangle in any of series is chosen, so peak of single series
+    is kept. Series should be scaled to the same range.
+
+    :param xs: X coordinates, ascending
+    :type xs: list
+    :param columns: Y coordinates of every series, None for missing values
+    :type columns: list
+    :param threshold: Count of chosen rows
+    :type threshold: int
+    :rtype: list
+    """
+    count = len(xs)
+    if threshold >= count or threshold < 3:
+        return range(count)
+
+    # first and last rows are always kept, rest is split to buckets
+    every = float(count - 2) / (threshold - 2)
+    indexes = [0]
+    previous = 0
+
+    for bucket in xrange(threshold - 2):
+        next_start = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, count)
+        next_x = sum(xs[next_start:next_end]) / float(next_end - next_start)
+        previous_x = xs[previous]
+
+        # series with value in previously chosen row and in next bucket
+        lines = []
+        for ys in columns:
+            next_ys = [y for y in ys[next_start:next_end] if y is not None]
+            if ys[previous] is not None and next_ys:
+                lines.append((ys, ys[previous], sum(next_ys) / len(next_ys)))
+
+        max_area = -1
+        chosen = int(bucket * every) + 1
+
+        # row forming the largest triangle with previously chosen row and
+        # average of next bucket
+        for index in xrange(chosen, next_start):
+            base_x = previous_x - next_x
+            offset_x = previous_x - xs[index]
+
+            for ys, previous_y, next_y in lines:
+                if ys[index] is None:
+                    continue
+
+                area = abs(
+                    base_x * (ys[index] - previous_y) -
+                    offset_x * (next_y - previous_y)
+                )
+                if area > max_area:
+                    max_area = area
+                    chosen = index
+
+        indexes.append(chosen)
+        previous = chosen
+
+    indexes.append(count - 1)
+
+    return indexes
+
+
+def downsample_rows(rows, threshold=DEFAULT_POINTS):
+    """
+    Reduce rows of x followed by values of series to at most ``threshold``
+    rows, chosen for all series at once. Values are scaled to range of
+    their series, so series of small values are not drowned out.
+
+    :param rows: Rows of x (datetime or number) and values, None values are
+        skipped
+    :type rows: list
+    :param threshold: Count of kept rows
+    :type threshold: int
+    :rtype: list
+    """
+    if not threshold or len(rows) <= threshold:
+        return rows
+
+    xs = [get_x(row[0]) for row in rows]
+    columns = []
+
+    for column in xrange(1, len(rows[0])):
+        ys = [row[column] for row in rows]
+        present = [y for y in ys if y is not None]
+        if not present:
+            continue
+
+        low = min(present)
+        scale = float(max(present) - low) or 1.0
+        columns.append([
+            None if y is None else (y - low) / scale for y in ys
+        ])
+
+    return [rows[index] for index in lttb_rows(xs, columns, threshold)]
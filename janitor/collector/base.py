@@ -1,8 +1,13 @@
 # -*- coding:utf-8 -*-
 import sqlite3
+import time
 from abc import abstractmethod, ABCMeta
+from collections import OrderedDict
 from datetime import datetime
 
+from janitor.chart.downsample import downsample_rows, DEFAULT_POINTS
+from janitor.collector import rollup
+from janitor.storage import Storage
 from janitor.utils import json_dumps
 
 CHART_JS = """
@@ -11,15 +16,21 @@ var data = new google.visualization.DataTable(),
 %(column_definition)s
 data.addRows(%(json_data)s);
 
-var options = {
-  title: '%(chart_name)s'
-};
+var options = %(chart_options)s;
 
 var chart_%(table_name)s = new google
     .visualization.LineChart(chart_div);
 chart_%(table_name)s.draw(data, options);
+charts['%(table_name)s'] = {
+    data: data, chart: chart_%(table_name)s, options: options
+};
 """
 
+CREATE_INDEX_SQL = (
+    'create index if not exists %(table_name)s_created_at '
+    'on %(table_name)s (created_at);'
+)
+
 
 class BaseCollect(object):
     """
@@ -31,23 +42,68 @@ class BaseCollect(object):
     chart_name = None
     table_name = None
     column_description = None
+    # pairs of name and type of columns, which identify series in table with
+    # more series, e.g. core of CPU
+    rollup_keys = ()
+    # keys of series shown on chart by last get_data() call, for collectors
+    # with rollup_keys
+    shown_keys = None
+    # unix timestamp and (keys, values) pairs of the latest stored samples
+    last_samples = None
+    # Prometheus types of rollup columns, gauge when not listed
+    metric_types = {}
+    # arguments of constructor, which reconfigure() applies to running
+    # collector
+    reconfigurable = ('interval', 'timeout', 'retention')
 
-    def __init__(self, connection, alerts=None):
+    def __init__(self, connection, alerts=None, retention=None, storage=None,
+                 interval=None, timeout=None):
         """
         :type connection sqlite3.Connection
+        :param interval: Seconds between collections, defaults to
+            config.INTERVAL
+        :type interval: float
+        :param timeout: Seconds collect() may take before its run is skipped,
+            defaults to config.COLLECT_TIMEOUT
+        :type timeout: float
+        :param retention: Retention policy overriding the default one, see
+            janitor.retention
+        :type retention: dict
+        :param storage: Storage gathering collected samples, shared by all
+            collectors of daemon
+        :type storage: janitor.storage.Storage
         """
         if not isinstance(connection, sqlite3.Connection):
             raise Exception(
                 'Connection must be instance of sqlite3.Connection'
             )
 
+        self.set_alerts(alerts)
+        self.retention = retention
+        self.interval = interval
+        self.timeout = timeout
+        self.connection = connection
+        self.cursor = connection.cursor()
+        self.storage = storage or Storage(connection)
+
+    def reconfigure(self, interval=None, timeout=None, retention=None):
+        """
+        Apply changed ``reconfigurable`` arguments, collector keeps its open
+        files and state
+        """
+        self.interval = interval
+        self.timeout = timeout
+        self.retention = retention
+
+    def set_alerts(self, alerts):
+        """
+        Replace alerts checked after collection, single alert can be given
+        """
         alerts = alerts or []
         if not isinstance(alerts, (tuple, list)):
             alerts = [alerts]
 
         self.alerts = alerts
-        self.connection = connection
-        self.cursor = connection.cursor()
 
     def is_installed(self):
         """
@@ -68,6 +124,12 @@ class BaseCollect(object):
         """
         pass
 
+    def install_index(self):
+        """
+        Create index on created_at column of collector table
+        """
+        self.cursor.execute(CREATE_INDEX_SQL % {'table_name': self.table_name})
+
     @abstractmethod
     def collect(self):
         """
@@ -75,13 +137,258 @@ class BaseCollect(object):
         """
         pass
 
+    def close(self):
+        """
+        Release files of collector, it is not used after config reload
+        """
+        pass
+
     @abstractmethod
-    def get_data(self, limit=30, interval=10):
+    def get_data(self, limit=30, interval=10, since=None):
         """
         Method used to retrieve data
+
+        :param since: Unix timestamp, only buckets since then are returned.
+            Series are not chosen again then, shown_keys of last call are
+            used.
+        :type since: int
         """
         pass
 
+    def get_last_id(self):
+        """
+        Return id of the latest collected row, it changes with every sample
+        """
+        return self.cursor.execute(
+            'select max(id) from %s;' % self.table_name
+        ).fetchone()[0]
+
+    @property
+    def rollup_columns(self):
+        """
+        Names of columns aggregated in rollup tables
+        """
+        return tuple(column[0] for column in self.column_description)
+
+    def get_rollup_table_name(self, interval):
+        """
+        Return name of the coarsest rollup table, that can answer query
+        grouped by given interval (in minutes)
+        """
+        return rollup.get_table_name(
+            self.table_name, rollup.choose_tier(interval),
+        )
+
+    def is_rollup_installed(self):
+        """
+        Check if all rollup tables of this collector exists
+        """
+        sql = "SELECT count(*) FROM sqlite_master WHERE type='table' AND " \
+              "name IN (%s);" % ', '.join(
+                  "'%s'" % rollup.get_table_name(self.table_name, tier)
+                  for tier in rollup.TIERS
+              )
+
+        return self.cursor.execute(sql).fetchone()[0] == len(rollup.TIERS)
+
+    def install_rollup(self):
+        """
+        Create missing rollup tables and fill them with already collected
+        data. Existing tiers are kept as they are, raw rows of their older
+        buckets can be purged already.
+        """
+        tables = set(
+            row[0] for row in self.cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type='table';"
+            )
+        )
+        # tiers with data, missing tier is filled from the coarsest one of
+        # them which buckets fit evenly into its buckets, from raw rows when
+        # there is none
+        filled = []
+
+        for tier in rollup.TIERS:
+            table_name = rollup.get_table_name(self.table_name, tier)
+
+            if table_name not in tables:
+                sources = [source for source in filled if tier % source == 0]
+                self.cursor.execute(rollup.get_create_sql(
+                    table_name, self.rollup_columns, self.rollup_keys,
+                ))
+                self.cursor.execute(rollup.get_backfill_sql(
+                    table_name,
+                    rollup.get_table_name(self.table_name, sources[-1])
+                    if sources else self.table_name,
+                    self.rollup_columns, tier, self.rollup_keys,
+                    bool(sources),
+                ))
+
+            filled.append(tier)
+
+        self.connection.commit()
+
+    def get_rollup_writes(self, values, created_at=None, keys=()):
+        """
+        Return list of (sql, params) adding collected values to current
+        bucket of every rollup tier. Values must be in order of
+        self.rollup_columns, keys in order of self.rollup_keys
+        """
+        now = int(time.time() if created_at is None else created_at)
+        columns = self.rollup_columns
+        keys = tuple(keys)
+
+        insert_params = ()
+        update_params = ()
+        for value in values:
+            insert_params += (value, value)
+            update_params += (value, value, value)
+
+        writes = []
+        for tier in rollup.TIERS:
+            table_name = rollup.get_table_name(self.table_name, tier)
+            bucket = rollup.get_bucket(tier, now)
+
+            writes.append((
+                rollup.get_insert_sql(table_name, columns, self.rollup_keys),
+                (bucket,) + keys + insert_params,
+            ))
+            writes.append((
+                rollup.get_update_sql(table_name, columns, self.rollup_keys),
+                update_params + (bucket,) + keys,
+            ))
+
+        return writes
+
+    def store(self, sql, values, created_at=None, keys=()):
+        """
+        Queue collected sample to be written into collector and rollup
+        tables. Parameters of ``sql`` are keys, values and sample timestamp.
+
+        :param sql: Parameterized insert statement
+        :type sql: str
+        :param values: Values in order of self.rollup_columns
+        :type values: tuple
+        :param created_at: Unix timestamp of sample, defaults to now
+        :type created_at: int
+        :param keys: Values of self.rollup_keys
+        :type keys: tuple
+        """
+        self.store_many(sql, ((keys, values),), created_at)
+
+    def store_many(self, sql, samples, created_at=None):
+        """
+        Queue samples of more series taken at the same time, see store()
+
+        :param samples: Pairs of keys and values
+        :type samples: list
+        """
+        created_at = int(time.time() if created_at is None else created_at)
+        samples = list(samples)
+        self.last_samples = (created_at, samples)
+        writes = []
+
+        for keys, values in samples:
+            writes.append((
+                sql, tuple(keys) + tuple(values) + (created_at,),
+            ))
+            writes.extend(self.get_rollup_writes(values, created_at, keys))
+
+        self.storage.write_many(writes)
+
+    def get_series(self, start, end, step, aggregate='avg'):
+        """
+        Return series of all rollup columns between start and end, grouped
+        by step. Data is read from the coarsest table, which can answer.
+
+        Series are named by get_series_names().
+
+        :param start: Unix timestamp, inclusive
+        :type start: int
+        :param end: Unix timestamp, exclusive
+        :type end: int
+        :param step: Seconds between points
+        :type step: int
+        :param aggregate: One of 'avg', 'min' or 'max'
+        :type aggregate: str
+        :return: Name of source table, list of timestamps and ordered dict of
+            column values
+        :rtype: tuple
+        """
+        tier = rollup.choose_series_tier(step)
+        table_name = self.table_name
+        if tier is not None:
+            table_name = rollup.get_table_name(table_name, tier)
+
+        sql = rollup.get_series_sql(
+            table_name, self.rollup_columns, step, aggregate, tier,
+            self.rollup_keys,
+        )
+        rows = self.cursor.execute(sql, (start, end)).fetchall()
+        keys = ()
+
+        if self.rollup_keys:
+            key_count = len(self.rollup_keys)
+            rows = [
+                (row[0], row[1:1 + key_count]) + row[1 + key_count:]
+                for row in rows
+            ]
+            keys = sorted(set(row[1] for row in rows))
+            rows = self.pivot(rows, keys)
+
+        names = self.get_series_names(keys)
+
+        columns = OrderedDict((name, []) for name in names)
+        timestamps = []
+        for row in rows:
+            timestamps.append(row[0])
+            for values, value in zip(columns.values(), row[1:]):
+                values.append(value)
+
+        return table_name, timestamps, columns
+
+    def get_series_names(self, keys=()):
+        """
+        Return names of series of rollup columns for given keys, series of
+        collectors with keys are named key.column, e.g. eth0.rx_bytes
+
+        :param keys: Tuples of values of self.rollup_keys
+        :type keys: list
+        :rtype: list
+        """
+        if not self.rollup_keys:
+            return list(self.rollup_columns)
+
+        return [
+            '%s.%s' % ('.'.join(str(value) for value in key), column)
+            for key in keys
+            for column in self.rollup_columns
+        ]
+
+    def get_current_keys(self):
+        """
+        Return keys of series this collector currently collects, as tuples
+        of values of self.rollup_keys
+        """
+        return []
+
+    def get_last_sample(self):
+        """
+        Return unix timestamp of the latest stored sample and ordered dict of
+        its values, named by get_series_names(); None before first sample
+        """
+        if not self.last_samples or not self.last_samples[1]:
+            return None
+
+        created_at, samples = self.last_samples
+        values = OrderedDict()
+
+        for keys, sample_values in samples:
+            values.update(zip(
+                self.get_series_names([tuple(keys)]), sample_values,
+            ))
+
+        return created_at, values
+
     def get_data_columns_description(self):
         columns_description = ('datetime', 'Timestamp'),
 
@@ -90,7 +397,29 @@ class BaseCollect(object):
 
         return columns_description
 
-    def get_chart_js(self, limit=30, interval=10):
+    def get_chart_options(self):
+        """
+        Options of Google chart
+        """
+        return {'title': self.chart_name}
+
+    def get_chart_js(self, limit=30, interval=10, points=DEFAULT_POINTS,
+                     cache=None):
+        """
+        :param points: Count of rows sent to chart, longer data are
+            downsampled; None sends all of them
+        :type points: int
+        :param cache: Cache of fetched data
+        :type cache: janitor.cache.DataCache
+        """
+        # data goes first, collectors can choose shown columns while fetching
+        if cache is None:
+            data = self.get_data(limit, interval)
+        else:
+            data = cache.get_data(self, limit, interval)
+
+        json_data = json_dumps(downsample_rows(data, points))
+
         column_definition = ''
         for column_type, column_name in self.get_data_columns_description():
             column_definition += "data.addColumn('%s', '%s');\n" % (
@@ -101,32 +430,98 @@ class BaseCollect(object):
         return CHART_JS % {
             'column_definition': column_definition,
             'table_name': self.table_name,
-            'json_data': json_dumps(self.get_data(limit, interval)),
-            'chart_name': self.chart_name
+            'json_data': json_data,
+            'chart_options': json_dumps(self.get_chart_options()),
         }
 
     def get_chart_div(self):
         return '<div id="chart_%s" class="chart"></div>' % self.table_name
 
-    def prepare_result(self, fetched_rows):
+    def get_limit_timestamp(self, limit, since=None):
+        """
+        Return unix timestamp of moment ``limit`` days ago, or ``since`` when
+        it is later
+        """
+        limit_timestamp = int(time.time()) - limit * 24 * 60 * 60
+
+        return max(limit_timestamp, since or 0)
+
+    def pivot(self, fetched_rows, keys):
+        """
+        Turn rows of (timestamp, key, value, ...) ordered by timestamp into
+        rows of timestamp followed by values of every key, in order of keys.
+        Values of keys missing in bucket stay None.
+        """
+        columns = {}
+        width = 0
         result = []
+        row = None
+
+        for fetched_row in fetched_rows:
+            timestamp, key = fetched_row[:2]
+            values = fetched_row[2:]
+
+            if not columns:
+                width = len(values)
+                columns = dict(
+                    (column_key, 1 + index * width)
+                    for index, column_key in enumerate(keys)
+                )
 
-        for row in fetched_rows:
-            row = list(row)
-            row[0] = datetime.strptime(row[0], '%Y-%m-%d %H:%M:%S')
-            result.append(row)
+            if row is None or row[0] != timestamp:
+                row = [timestamp] + [None] * (len(columns) * width)
+                result.append(row)
+
+            offset = columns[key]
+            row[offset:offset + width] = values
 
         return result
 
-    def current_status(self):
+    def prepare_result(self, fetched_rows):
+        fromtimestamp = datetime.fromtimestamp
+
+        return [
+            [fromtimestamp(row[0])] + list(row[1:])
+            for row in fetched_rows
+        ]
+
+    def current_status(self, sample=None):
         """
-        Returns current status of data
+        Returns current status of data, from the latest sample kept in memory
 
-        :return: List with status
+        :param sample: Unix timestamp and ordered dict of values named by
+            get_series_names(), by default get_last_sample() of this
+            collector; data server passes the one read from ring buffer
+        :type sample: tuple
+        :return: List of (column, labels, value), labels are ordered dict of
+            values of rollup_keys
         :rtype: list
         """
+        if sample is None:
+            sample = self.get_last_sample()
+        if sample is None:
+            return []
+
+        key_names = [key[0] for key in self.rollup_keys]
+        status = []
+
+        for name, value in sample[1].iteritems():
+            if value is None:
+                continue
+
+            column = name
+            labels = OrderedDict()
+            if key_names:
+                # column names have no dots, keys (e.g. eth0.100) can
+                key, column = name.rsplit('.', 1)
+                labels.update(zip(
+                    key_names, key.split('.', len(key_names) - 1),
+                ))
+
+            status.append((column, labels, value))
+
+        return status
 
     def check_for_alerts(self):
         for alert in self.alerts:
-            if alert.check(self):
-                alert.alert()
+            alert.check(self)
@@ -2,15 +2,53 @@
 """
 Classes collecting data about CPU
 """
-import re
-from datetime import timedelta, datetime
+import operator
+from array import array
 
 from janitor.collector.base import BaseCollect
+from janitor.procfs import PROC_ROOT, StatReader, STAT_FIELDS, STAT_IDLE
+
+# value of core column for total usage of all cores
+TOTAL = -1
+
+INSTALL_SQL = (
+    'create table %s ('
+    '  id INTEGER PRIMARY KEY AUTOINCREMENT, '
+    '  core INTEGER, '
+    '  usage REAL, '
+    '  created_at INTEGER DEFAULT (strftime(\'%%s\', \'now\'))'
+    ');'
+)
+
+INSERT_SQL = 'insert into %s (core, usage, created_at) values (?, ?, ?);'
+
+FETCH_DATA_SQL = (
+    'select '
+    '  bucket / %(step)i * %(step)i as timestamp, '
+    '  core, '
+    '  round(sum(usage_sum) / sum(samples), 2) as usage '
+    'from %(table_name)s '
+    'where bucket >= ? and core in (%(cores)s) '
+    'group by 1, 2 '
+    'order by 1;'
+)
+
+FETCH_CORES_SQL = (
+    'select core '
+    'from %(table_name)s '
+    'where bucket >= ? and core != %(total)i '
+    'group by core '
+    'order by %(order)s '
+    'limit ?;'
+)
 
 
 class CPULoadCollect(BaseCollect):
     """
     Collect CPU load
+
+    Usage of every core is stored as separate row with core number, total
+    usage has core TOTAL.
     """
     chart_name = 'CPU usage'
 
@@ -18,24 +56,41 @@ class CPULoadCollect(BaseCollect):
 
     time_list = None
 
-    proc_stat_fd = file("/proc/stat", "r")
-
-    # in /proc/stat each core/thread is name as cpu#
-    column_description = (
-        ('cpu', 'number', 'Total percentage usage'),
-        ('cpu0', 'number', '#1 percentage usage'),
-        ('cpu1', 'number', '#2 percentage usage'),
-        ('cpu2', 'number', '#3 percentage usage'),
-        ('cpu3', 'number', '#4 percentage usage'),
-        ('cpu4', 'number', '#5 percentage usage'),
-        ('cpu5', 'number', '#6 percentage usage'),
-        ('cpu6', 'number', '#7 percentage usage'),
-        ('cpu7', 'number', '#8 percentage usage'),
-    )
-
-    def __init__(self, connection, alerts=None):
+    rollup_columns = ('usage',)
+
+    rollup_keys = (('core', 'INTEGER'),)
+
+    reconfigurable = BaseCollect.reconfigurable + ('chart_cores',)
+
+    def __init__(self, connection, alerts=None, chart_cores=None,
+                 proc_root=PROC_ROOT, **kwargs):
+        """
+        :param chart_cores: Max count of cores shown on chart, the busiest
+            ones are chosen; all cores are shown by default
+        :type chart_cores: int
+        :param proc_root: Mount point of procfs, recorded files for benchmarks
+        :type proc_root: str
+        """
+        self.chart_cores = chart_cores
+        self.proc_stat = StatReader(proc_root)
         self.time_list = self.get_time_list()
-        super(CPULoadCollect, self).__init__(connection, alerts)
+        super(CPULoadCollect, self).__init__(connection, alerts, **kwargs)
+
+    def reconfigure(self, chart_cores=None, **kwargs):
+        self.chart_cores = chart_cores
+        super(CPULoadCollect, self).reconfigure(**kwargs)
+
+    @property
+    def column_description(self):
+        cores = self.shown_keys
+        if cores is None:
+            cores = range(self.count_cores)
+
+        # in /proc/stat each core/thread is name as cpu#
+        return (('cpu', 'number', 'Total percentage usage'),) + tuple(
+            ('cpu%i' % core, 'number', '#%i percentage usage' % (core + 1))
+            for core in cores
+        )
 
     @property
     def count_cores(self):
@@ -45,62 +100,52 @@ class CPULoadCollect(BaseCollect):
         :return: Cores count
         :rtype: int
         """
-        self.proc_stat_fd.seek(0)
+        return self.proc_stat.cores
 
-        return sum(tuple(
-            1
-            for line in self.proc_stat_fd.readlines()
-            if re.match('cpu\d+.*', line)
-        ))
+    def get_current_keys(self):
+        return [(TOTAL,)] + [(core,) for core in xrange(self.count_cores)]
+
+    def current_status(self, sample=None):
+        status = super(CPULoadCollect, self).current_status(sample)
+
+        for column, labels, value in status:
+            if labels['core'] == str(TOTAL):
+                labels['core'] = 'total'
+
+        return status
+
+    def close(self):
+        self.proc_stat.close()
 
     def install(self):
-        sql = 'create table %s (' \
-              '  id INTEGER PRIMARY KEY AUTOINCREMENT, ' \
-              '  cpu REAL, ' \
-              '  cpu0 REAL, ' \
-              '  cpu1 REAL NULL, ' \
-              '  cpu2 REAL NULL, ' \
-              '  cpu3 REAL NULL, ' \
-              '  cpu4 REAL NULL, ' \
-              '  cpu5 REAL NULL, ' \
-              '  cpu6 REAL NULL, ' \
-              '  cpu7 REAL NULL, ' \
-              '  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP' \
-              ');' % self.table_name
-
-        self.cursor.execute(sql)
+        self.cursor.execute(INSTALL_SQL % self.table_name)
+        self.install_index()
 
         self.connection.commit()
 
     def get_time_list(self):
         """
+        Return copy of counters of total cpu and every core, flattened into
+        one array, STAT_FIELDS counters per row
+
         http://www.linuxhowtos.org/System/procstat.htm
         """
-        # dirty fix, when we want to quickly read second time, we have problem,
-        # because delta is 0
-        self.proc_stat_fd.seek(0)
-        cpu_times = {}
-
-        for line in self.proc_stat_fd.readlines():
-            if not line.startswith('cpu'):
-                continue
-
-            columns = line.split(' ')
-            cpu_times[columns[0]] = map(int, filter(None, columns[1:]))
-
-        return cpu_times
+        return array('L', self.proc_stat.read())
 
     def get_delta_time(self):
         """
-        Return difference of cpu stats between last call and current call
+        Return difference of cpu stats between last call and current call,
+        in the same flat layout as get_time_list()
         """
         current_time_list = self.get_time_list()
-        delta_times = {}
-        for k in current_time_list.keys():
-            delta_times[k] = [
-                (t2 - t1)
-                for t1, t2 in zip(self.time_list[k], current_time_list[k])
-            ]
+
+        if len(current_time_list) != len(self.time_list):
+            # cores went on or off line, there is nothing to compare with
+            delta_times = [0] * len(current_time_list)
+        else:
+            delta_times = map(
+                operator.sub, current_time_list, self.time_list,
+            )
 
         self.time_list = current_time_list
 
@@ -108,99 +153,77 @@ class CPULoadCollect(BaseCollect):
 
     def get_cpu_load(self):
         """
-        Returns load of all CPus in system
+        Returns list of loads of total cpu and of every core
         """
         delta_times = self.get_delta_time()
-        cpu_loads = {}
-        for k in delta_times.keys():
-            dt = list(delta_times[k])
-            idle_time = float(dt[3])
-            total_time = sum(dt)
+        cpu_loads = []
+
+        for offset in xrange(0, len(delta_times), STAT_FIELDS):
+            total_time = sum(delta_times[offset:offset + STAT_FIELDS])
+            idle_time = float(delta_times[offset + STAT_IDLE])
             dt_load = (idle_time / total_time) if total_time > 0 else 1
-            cpu_loads[k] = 1 - (dt_load)
+            cpu_loads.append(1 - dt_load)
 
         return cpu_loads
 
-    def sort_values(self, cpu, cpu0=None, cpu1=None, cpu2=None, cpu3=None,
-                    cpu4=None, cpu5=None, cpu6=None, cpu7=None):
-        """
-        Small helper, I need tuple in correct order
-
-        :param cpu:
-        :type cpu:
-        :param cpu0:
-        :type cpu0:
-        :param cpu1:
-        :type cpu1:
-        :param cpu2:
-        :type cpu2:
-        :param cpu3:
-        :type cpu3:
-        :param cpu4:
-        :type cpu4:
-        :param cpu5:
-        :type cpu5:
-        :param cpu6:
-        :type cpu6:
-        :param cpu7:
-        :type cpu7:
-        :return: Tuple
-        :rtype: tuple
-        """
-        return cpu, cpu0, cpu1, cpu2, cpu3, cpu4, cpu5, cpu6, cpu7
-
     def collect(self):
-        cpu, cpu0, cpu1, cpu2, cpu3, cpu4, cpu5, cpu6, cpu7 = \
-            tuple(
-                (p if p else 0) * 100.0
-                for p in self.sort_values(**self.get_cpu_load())
-            )
-
-        data_to_insert = (
-            self.table_name,
-            cpu,
-            cpu0,
-            cpu1,
-            cpu2,
-            cpu3,
-            cpu4,
-            cpu5,
-            cpu6,
-            cpu7,
+        loads = self.get_cpu_load()
+
+        self.store_many(
+            INSERT_SQL % self.table_name,
+            [((TOTAL,), (loads[0] * 100.0,))] + [
+                ((core,), (load * 100.0,))
+                for core, load in enumerate(loads[1:])
+            ],
         )
 
-        sql = 'insert into %s ' \
-              '(cpu, cpu0, cpu1, cpu2, cpu3, cpu4, cpu5, cpu6, cpu7) ' \
-              'values (%f, %f, %f, %f, %f, %f, %f, %f, %f);'
-
-        self.cursor.execute(sql % data_to_insert)
-        self.connection.commit()
-
-    def get_data(self, limit=30, interval=10):
-        limit_date = datetime.now()-timedelta(days=limit)
-        params = {
-            'interval': interval,
-            'table_name': self.table_name,
-            'limit_date': limit_date.strftime('%Y-%m-%d'),
+    def get_chart_cores(self, table_name, limit_timestamp):
+        """
+        Return cores shown on chart, at most self.chart_cores of the busiest
+        """
+        if self.chart_cores is None:
+            order = 'core'
+            count = -1
+        else:
+            order = 'sum(usage_sum) / sum(samples) desc'
+            count = self.chart_cores
+
+        cores = [
+            row[0]
+            for row in self.cursor.execute(FETCH_CORES_SQL % {
+                'table_name': table_name,
+                'total': TOTAL,
+                'order': order,
+            }, (limit_timestamp, count))
+        ]
+
+        return sorted(cores)
+
+    def get_chart_options(self):
+        options = super(CPULoadCollect, self).get_chart_options()
+
+        if len(self.shown_keys or ()) > 16:
+            # legend of that many series only takes space from the chart
+            options['legend'] = {'position': 'none'}
+            options['lineWidth'] = 1
+
+        return options
+
+    def get_data(self, limit=30, interval=10, since=None):
+        table_name = self.get_rollup_table_name(interval)
+        limit_timestamp = self.get_limit_timestamp(limit, since)
+        if since is None or self.shown_keys is None:
+            self.shown_keys = self.get_chart_cores(table_name, limit_timestamp)
+
+        sql = FETCH_DATA_SQL % {
+            'step': interval * 60,
+            'table_name': table_name,
+            'cores': ', '.join(
+                str(core) for core in [TOTAL] + self.shown_keys
+            ),
         }
 
-        sql = 'select ' \
-              ' strftime(\'%%Y-%%m-%%d %%H:\', created_at) || ' \
-              '   (strftime(\'%%M\', created_at)/%(interval)s) || ' \
-              '   \'0:00\' as timestamp, ' \
-              '  round(avg(cpu),2) as cpu, ' \
-              '  round(avg(cpu0),2) as cpu0, ' \
-              '  round(avg(cpu1),2) as cpu1, ' \
-              '  round(avg(cpu2),2) as cpu2, ' \
-              '  round(avg(cpu3),2) as cpu3, ' \
-              '  round(avg(cpu4),2) as cpu4, ' \
-              '  round(avg(cpu5),2) as cpu5, ' \
-              '  round(avg(cpu6),2) as cpu6, ' \
-              '  round(avg(cpu7),2) as cpu7 ' \
-              'from %(table_name)s ' \
-              'where DATE(created_at) > \'%(limit_date)s\' ' \
-              'group by strftime(\'%%Y%%m%%d%%H0\', created_at) + ' \
-              '  strftime(\'%%M\', created_at)/%(interval)s' \
-              ';' % params
-
-        return self.prepare_result(self.cursor.execute(sql).fetchall())
+        return self.prepare_result(self.pivot(
+            self.cursor.execute(sql, (limit_timestamp,)),
+            [TOTAL] + self.shown_keys,
+        ))
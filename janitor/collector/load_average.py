@@ -1,10 +1,6 @@
 # -*- coding:utf-8 -*-
-import re
-from datetime import timedelta, datetime
-
 from janitor.collector.base import BaseCollect
-
-LA_PATTERN = '(?P<la1>\d+\.\d+) (?P<la5>\d+\.\d+) (?P<la15>\d+\.\d+) .*'
+from janitor.procfs import PROC_ROOT, LoadavgReader
 
 INSTALL_SQL = (
     'create table %s ('
@@ -12,25 +8,23 @@ INSTALL_SQL = (
     '  la1 REAL, '
     '  la5 REAL, '
     '  la15 REAL, '
-    '  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP'
+    '  created_at INTEGER DEFAULT (strftime(\'%%s\', \'now\'))'
     ');'
 )
 
-INSERT_SQL = 'insert into %s (la1, la5, la15) VALUES (%f, %f, %f)'
+INSERT_SQL = (
+    'insert into %s (la1, la5, la15, created_at) VALUES (?, ?, ?, ?)'
+)
 
 FETCH_DATA_SQL = (
     'select '
-    ' strftime(\'%%Y-%%m-%%d %%H:\', created_at) || '
-    '   (strftime(\'%%M\', created_at)/%(interval)s) || '
-    '     \'0:00\' as timestamp, '
-    '  round(avg(la1), 2) as la1, '
-    '  round(avg(la5), 2) as la5, '
-    '  round(avg(la15), 2) as la15 '
+    '  bucket / %(step)i * %(step)i as timestamp, '
+    '  round(sum(la1_sum) / sum(samples), 2) as la1, '
+    '  round(sum(la5_sum) / sum(samples), 2) as la5, '
+    '  round(sum(la15_sum) / sum(samples), 2) as la15 '
     'from %(table_name)s '
-    'where DATE(created_at) > \'%(limit_date)s\' '
-    'group by strftime(\'%%Y%%m%%d%%H0\', created_at) + '
-    '  strftime(\'%%M\', created_at)/%(interval)s'
-    ';'
+    'where bucket >= ? '
+    'group by 1;'
 )
 
 
@@ -45,34 +39,37 @@ class LoadAverageCollect(BaseCollect):
         ('la15', 'number', 'Load avg. from last 15 min.'),
     )
 
+    def __init__(self, connection, alerts=None, proc_root=PROC_ROOT,
+                 **kwargs):
+        """
+        :param proc_root: Mount point of procfs, recorded files for benchmarks
+        :type proc_root: str
+        """
+        self.loadavg = LoadavgReader(proc_root)
+        super(LoadAverageCollect, self).__init__(connection, alerts, **kwargs)
+
+    def close(self):
+        self.loadavg.close()
+
     def install(self):
         sql = INSTALL_SQL % self.table_name
         self.cursor.execute(sql)
+        self.install_index()
         self.connection.commit()
 
     def get_load_avg(self):
-        with open('/proc/loadavg', 'r') as fh:
-            la = fh.read()
-            la_dict = re.match(LA_PATTERN, la).groupdict()
-
-        return float(la_dict['la1']), \
-            float(la_dict['la5']), \
-            float(la_dict['la15'])
+        return self.loadavg.read()
 
     def collect(self):
-        la1, la5, la15 = self.get_load_avg()
-
-        data_to_insert = (self.table_name, la1, la5, la15)
-
-        self.cursor.execute(INSERT_SQL % data_to_insert)
-        self.connection.commit()
+        self.store(INSERT_SQL % self.table_name, self.get_load_avg())
 
-    def get_data(self, limit=30, interval=10):
-        limit_date = datetime.now() - timedelta(days=limit)
+    def get_data(self, limit=30, interval=10, since=None):
         sql = FETCH_DATA_SQL % {
-            'interval': interval,
-            'table_name': self.table_name,
-            'limit_date': limit_date.strftime('%Y-%m-%d')
+            'step': interval * 60,
+            'table_name': self.get_rollup_table_name(interval),
         }
+        params = (self.get_limit_timestamp(limit, since),)
 
-        return self.prepare_result(self.cursor.execute(sql).fetchall())
+        return self.prepare_result(
+            self.cursor.execute(sql, params).fetchall()
+        )
@@ -1,7 +1,6 @@
 # -*- coding:utf-8 -*-
-from datetime import timedelta, datetime
-
 from janitor.collector.base import BaseCollect
+from janitor.procfs import PROC_ROOT, MeminfoReader
 
 
 CREATE_SQL = (
@@ -13,34 +12,34 @@ CREATE_SQL = (
     '  physical_cache INTEGER, '
     '  swap_total INTEGER, '
     '  swap_used INTEGER, '
-    '  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP'
+    '  created_at INTEGER DEFAULT (strftime(\'%%s\', \'now\'))'
     ');'
 )
 
 INSERT_SQL = (
     'insert into %s ('
     '  physical_total, physical_used, physical_buffers,'
-    '  physical_cache, swap_total, swap_used'
+    '  physical_cache, swap_total, swap_used, created_at'
     ') '
-    'VALUES (%i, %i, %i, %i, %i, %i)'
+    'VALUES (?, ?, ?, ?, ?, ?, ?)'
 )
 
 FETCH_DATA_SQL = (
     'select '
-    ' strftime(\'%%Y-%%m-%%d %%H:\', created_at) || '
-    '   (strftime(\'%%M\', created_at)/%(interval)s) || '
-    '   \'0:00\' as timestamp, '
-    '  cast(avg(physical_total)/1024 as integer) as physical_total, '
-    '  cast(avg(physical_used)/1024 as integer) as physical_used, '
-    '  cast(avg(physical_buffers)/1024 as integer) as physical_buffers, '
-    '  cast(avg(physical_cache)/1024 as integer) as physical_cache, '
-    '  cast(avg(swap_total)/1024 as integer) as swap_total, '
-    '  cast(avg(swap_used)/1024 as integer) as swap_used '
+    '  bucket / %(step)i * %(step)i as timestamp, '
+    '  cast(sum(physical_total_sum)/sum(samples)/1024 as integer) '
+    '    as physical_total, '
+    '  cast(sum(physical_used_sum)/sum(samples)/1024 as integer) '
+    '    as physical_used, '
+    '  cast(sum(physical_buffers_sum)/sum(samples)/1024 as integer) '
+    '    as physical_buffers, '
+    '  cast(sum(physical_cache_sum)/sum(samples)/1024 as integer) '
+    '    as physical_cache, '
+    '  cast(sum(swap_total_sum)/sum(samples)/1024 as integer) as swap_total, '
+    '  cast(sum(swap_used_sum)/sum(samples)/1024 as integer) as swap_used '
     'from %(table_name)s '
-    'where DATE(created_at) > \'%(limit_date)s\' '
-    'group by strftime(\'%%Y%%m%%d%%H0\', created_at) + '
-    '  strftime(\'%%M\', created_at)/%(interval)s'
-    ';'
+    'where bucket >= ? '
+    'group by 1;'
 )
 
 
@@ -60,9 +59,33 @@ class MemoryCollect(BaseCollect):
 
     last_reading = ()
 
+    # names of current status of columns, values are in bytes; column
+    # physical_used holds MemFree of /proc/meminfo
+    status_names = {
+        'physical_total': 'physical_total_bytes',
+        'physical_used': 'physical_free_bytes',
+        'physical_buffers': 'physical_buffers_bytes',
+        'physical_cache': 'physical_cache_bytes',
+        'swap_total': 'swap_total_bytes',
+        'swap_used': 'swap_used_bytes',
+    }
+
+    def __init__(self, connection, alerts=None, proc_root=PROC_ROOT,
+                 **kwargs):
+        """
+        :param proc_root: Mount point of procfs, recorded files for benchmarks
+        :type proc_root: str
+        """
+        self.meminfo = MeminfoReader(proc_root)
+        super(MemoryCollect, self).__init__(connection, alerts, **kwargs)
+
+    def close(self):
+        self.meminfo.close()
+
     def install(self):
         sql = CREATE_SQL % self.table_name
         self.cursor.execute(sql)
+        self.install_index()
         self.connection.commit()
 
     def collect(self):
@@ -70,60 +93,42 @@ class MemoryCollect(BaseCollect):
             self.get_memory_usage()
 
         data_to_insert = (
-            self.table_name,
             mem_total,
             mem_free,
             mem_buffers,
             mem_cache, swap_total, swap_used,
         )
 
-        self.cursor.execute(INSERT_SQL % data_to_insert)
-        self.connection.commit()
+        self.store(INSERT_SQL % self.table_name, data_to_insert)
 
     def get_memory_usage(self):
-        swap_total = swap_total = swap_free = mem_total = mem_free = \
-            mem_buffers = mem_cache = 0
-
-        with open('/proc/meminfo', 'r') as f:
-            mem_total = mem_free = mem_buffers = \
-                mem_cache = swap_total = swap_free = None
-            for line in f:
-                if line.startswith('SwapTotal:'):
-                    swap_total = int(line.split()[1])
-                elif line.startswith('SwapFree:'):
-                    swap_free = int(line.split()[1])
-                elif line.startswith('MemTotal:'):
-                    mem_total = int(line.split()[1])
-                elif line.startswith('MemFree:'):
-                    mem_free = int(line.split()[1])
-                elif line.startswith('Cached:'):
-                    mem_cache = int(line.split()[1])
-                elif line.startswith('Buffers:'):
-                    mem_buffers = int(line.split()[1])
-
-                have_values = all((
-                    mem_total, mem_free, mem_buffers,
-                    mem_cache, swap_total, swap_free,
-                ))
-                if have_values:
-                    break
-
-            self.last_reading = (
-                swap_total, swap_total - swap_free,
-                mem_total, mem_free, mem_buffers, mem_cache,
-            )
-
-            return self.last_reading
-
-    def get_data(self, limit=30, interval=10):
-        limit_date = datetime.now()-timedelta(days=limit)
+        swap_total, swap_free, mem_total, mem_free, mem_buffers, mem_cache = \
+            self.meminfo.read()
+
+        self.last_reading = (
+            swap_total, swap_total - swap_free,
+            mem_total, mem_free, mem_buffers, mem_cache,
+        )
+
+        return self.last_reading
+
+    def current_status(self, sample=None):
+        return [
+            (self.status_names[column], labels, value * 1024)
+            for column, labels, value
+            in super(MemoryCollect, self).current_status(sample)
+        ]
+
+    def get_data(self, limit=30, interval=10, since=None):
         sql = FETCH_DATA_SQL % {
-            'interval': interval,
-            'table_name': self.table_name,
-            'limit_date': limit_date.strftime('%Y-%m-%d'),
+            'step': interval * 60,
+            'table_name': self.get_rollup_table_name(interval),
         }
+        params = (self.get_limit_timestamp(limit, since),)
 
-        return self.prepare_result(self.cursor.execute(sql).fetchall())
+        return self.prepare_result(
+            self.cursor.execute(sql, params).fetchall()
+        )
 
     def get_ram_usage(self):
         total_mem = self.last_reading[2]
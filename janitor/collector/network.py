@@ -1,12 +1,16 @@
 # -*- coding:utf-8 -*-
-from datetime import timedelta, datetime
+from fnmatch import fnmatch
 
 from janitor.collector.base import BaseCollect
-from janitor.utils import json_dumps
+from janitor.procfs import PROC_ROOT, NetDevReader
+
+# counters of 32-bit kernels wrap at this value
+COUNTER_WRAP = 2 ** 32
 
 INSTALL_SQL = (
     'create table %s ('
     '  id INTEGER PRIMARY KEY AUTOINCREMENT, '
+    '  interface TEXT, '
     '  rx_bytes INTEGER, '
     '  tx_bytes INTEGER, '
     '  rx_packets INTEGER, '
@@ -15,154 +19,231 @@ INSTALL_SQL = (
     '  tx_bytes_delta INTEGER, '
     '  rx_packets_delta INTEGER, '
     '  tx_packets_delta INTEGER, '
-    '  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP'
+    '  created_at INTEGER DEFAULT (strftime(\'%%s\', \'now\'))'
     ');'
 )
 INSERT_SQL = (
     'insert into %s ('
-    '  rx_bytes, tx_bytes, rx_packets, tx_packets, '
-    '  rx_bytes_delta, tx_bytes_delta, rx_packets_delta, tx_packets_delta) '
-    'VALUES (%i, %i, %i, %i, %i, %i, %i, %i)'
+    '  interface, rx_bytes, tx_bytes, rx_packets, tx_packets, '
+    '  rx_bytes_delta, tx_bytes_delta, rx_packets_delta, tx_packets_delta, '
+    '  created_at) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
 )
 
 FETCH_DATA_SQL = (
     'select '
-    ' strftime(\'%%Y-%%m-%%d %%H:\', created_at) || '
-    '   (strftime(\'%%M\', created_at)/%(interval)s) || '
-    '   \'0:00\' as timestamp, '
-    '  round(rx_bytes/1024, 2) as rx_bytes, '
-    '  round(tx_bytes/1024, 2) as tx_bytes, '
-    '  round(rx_packets/1024, 2) as rx_packets, '
-    '  round(tx_packets/1024, 2) as tx_packets, '
-    '  round(sum(rx_bytes_delta)/1024, 2) as rx_bytes, '
-    '  round(sum(tx_bytes_delta)/1024, 2) as tx_bytes, '
-    '  sum(rx_packets_delta) as rx_packets, '
-    '  sum(tx_packets_delta)as tx_packets '
+    '  bucket / %(step)i * %(step)i as timestamp, '
+    '  interface, '
+    '  round(sum(rx_bytes_delta_sum)/1024, 2) as rx_bytes, '
+    '  round(sum(tx_bytes_delta_sum)/1024, 2) as tx_bytes '
+    'from %(table_name)s '
+    'where bucket >= ? and interface in (%(placeholders)s) '
+    'group by 1, 2 '
+    'order by 1;'
+)
+
+FETCH_INTERFACES_SQL = (
+    'select interface '
     'from %(table_name)s '
-    'where DATE(created_at) > \'%(limit_date)s\' '
-    'group by strftime(\'%%Y%%m%%d%%H0\', created_at) + '
-    '  strftime(\'%%M\', created_at)/%(interval)s;'
+    'where bucket >= ? '
+    'group by interface '
+    'order by sum(rx_bytes_delta_sum + tx_bytes_delta_sum) desc '
+    'limit ?;'
 )
 
 
 class NetworkCollect(BaseCollect):
-    time_list = None
+    """
+    Collect traffic of all network interfaces, each interface is stored as
+    separate row
+    """
+    chart_name = 'Network usage'
 
-    network_stats_fd = open('/proc/net/dev', 'r')
+    table_name = 'network_usage'
 
     network_stats = None
 
-    column_description = (
-        ('rx_bytes', 'number', 'Total received data'),
-        ('tx_bytes', 'number', 'Total transferred data'),
-        ('rx_packets', 'number', 'Total received pockets'),
-        ('tx_packets', 'number', 'Total transferred pockets'),
-        ('rx_bytes_delta', 'number', 'Received data'),
-        ('tx_bytes_delta', 'number', 'Transferred data'),
-        ('rx_packets_delta', 'number', 'Received pockets'),
-        ('tx_packets_delta', 'number', 'Transferred pockets'),
+    rollup_columns = (
+        'rx_bytes', 'tx_bytes', 'rx_packets', 'tx_packets',
+        'rx_bytes_delta', 'tx_bytes_delta', 'rx_packets_delta',
+        'tx_packets_delta',
     )
 
-    @property
-    def table_name(self):
-        return 'network_%s_usage' % self.interface
+    rollup_keys = (('interface', 'TEXT'),)
+
+    # counters read from /proc/net/dev, deltas are per collection
+    metric_types = {
+        'rx_bytes': 'counter',
+        'tx_bytes': 'counter',
+        'rx_packets': 'counter',
+        'tx_packets': 'counter',
+    }
+
+    reconfigurable = BaseCollect.reconfigurable + ('chart_interfaces',)
+
+    def __init__(self, connection, alerts=None, include=None, exclude=None,
+                 chart_interfaces=5, interface=None, proc_root=PROC_ROOT,
+                 **kwargs):
+        """
+        :param include: Glob patterns of collected interfaces, all by default
+        :type include: list
+        :param exclude: Glob patterns of interfaces, which are not collected
+        :type exclude: list
+        :param chart_interfaces: Count of interfaces with the most traffic
+            shown on chart
+        :type chart_interfaces: int
+        :param interface: Single collected interface, kept for old configs,
+            same as ``include=[interface]``
+        :type interface: str
+        :param proc_root: Mount point of procfs, recorded files for benchmarks
+        :type proc_root: str
+        """
+        if interface is not None:
+            include = [interface]
+
+        self.include = include
+        self.exclude = exclude or []
+        self.chart_interfaces = chart_interfaces
+        # results of include and exclude patterns, by interface name
+        self.filtered = {}
+        self.net_dev = NetDevReader(proc_root)
+        self.network_stats = self.get_interfaces_stats()
+        super(NetworkCollect, self).__init__(connection, alerts, **kwargs)
+
+    def reconfigure(self, chart_interfaces=5, **kwargs):
+        self.chart_interfaces = chart_interfaces
+        super(NetworkCollect, self).reconfigure(**kwargs)
 
     @property
-    def chart_name(self):
-        return 'Network usage on %s' % self.interface
-
-    def __init__(self, connection, alerts=None, interface='eth0'):
-        self.interface = interface
-        self.network_stats = self.get_interface_stats()
-        super(NetworkCollect, self).__init__(connection, alerts)
-
-    def get_interface_stats(self):
-        self.network_stats_fd.seek(0)
-        for line in self.network_stats_fd.readlines()[2:]:
-            line = line.split(':')
-            if line[0].strip() == self.interface:
-                counters = line[1].split()
-                return {
-                    'rx_bytes': int(counters[0]),
-                    'tx_bytes': int(counters[8]),
-                    'rx_packets': int(counters[1]),
-                    'tx_packets': int(counters[9]),
-                }
-
-        raise Exception('The interface `%s` is missing!' % self.interface)
+    def column_description(self):
+        description = ()
+
+        for interface in self.shown_keys or ():
+            description += (
+                ('%s_rx' % interface, 'number', 'Received on %s' % interface),
+                (
+                    '%s_tx' % interface, 'number',
+                    'Transferred on %s' % interface,
+                ),
+            )
+
+        return description
+
+    def get_current_keys(self):
+        return [(interface,) for interface in sorted(self.network_stats)]
+
+    def is_collected(self, interface):
+        collected = self.filtered.get(interface)
+
+        if collected is None:
+            collected = (
+                self.include is None or
+                any(fnmatch(interface, pattern) for pattern in self.include)
+            ) and not any(
+                fnmatch(interface, pattern) for pattern in self.exclude
+            )
+            self.filtered[interface] = collected
+
+        return collected
+
+    def get_interfaces_stats(self):
+        """
+        Return dict of interface name and tuple of its rx bytes, tx bytes,
+        rx packets and tx packets counters, /proc/net/dev is read once
+        """
+        interfaces = self.net_dev.read()
+
+        if len(self.filtered) > len(interfaces):
+            # forget interfaces which disappeared, e.g. of stopped containers
+            self.filtered = dict(
+                (interface, collected)
+                for interface, collected in self.filtered.iteritems()
+                if interface in interfaces
+            )
+
+        return dict(
+            (interface, tuple(counters))
+            for interface, counters in interfaces.items()
+            if self.is_collected(interface)
+        )
+
+    def get_delta(self, previous, current):
+        """
+        Return increase of counter, handling its wraparound and reset
+        """
+        if current >= previous:
+            return current - previous
+
+        if COUNTER_WRAP / 2 < previous < COUNTER_WRAP:
+            return current + COUNTER_WRAP - previous
+
+        # counter was reset, e.g. interface was recreated
+        return current
 
     def get_delta_stats(self):
-        current_network_stats = self.get_interface_stats()
-        delta_stats = {
-            '%s_delta' % k: current_network_stats[k] - self.network_stats[k]
-            for k in self.network_stats
-        }
+        """
+        Return list of pairs of interface name and its current counters
+        followed by their deltas. Interfaces seen first time are only
+        remembered for next call.
+        """
+        current_network_stats = self.get_interfaces_stats()
+        stats = []
+
+        for interface, counters in sorted(current_network_stats.items()):
+            previous = self.network_stats.get(interface)
+            if previous is None:
+                continue
+
+            stats.append((interface, counters + tuple(
+                self.get_delta(*pair) for pair in zip(previous, counters)
+            )))
+
         self.network_stats = current_network_stats
-        return delta_stats['rx_bytes_delta'], \
-            delta_stats['tx_bytes_delta'], \
-            delta_stats['rx_packets_delta'], \
-            delta_stats['tx_packets_delta']
 
-    def get_current_stats(self):
-        return self.network_stats['rx_bytes'], \
-            self.network_stats['tx_bytes'], \
-            self.network_stats['rx_packets'], \
-            self.network_stats['tx_packets']
+        return stats
 
     def collect(self):
-        self.cursor.execute(INSERT_SQL % (
-            (self.table_name,) +
-            self.get_current_stats() +
-            self.get_delta_stats())
-        )
+        self.store_many(INSERT_SQL % self.table_name, [
+            ((interface,), values)
+            for interface, values in self.get_delta_stats()
+        ])
 
-        self.get_interface_stats()
+    def close(self):
+        self.net_dev.close()
 
     def install(self):
         sql = INSTALL_SQL % self.table_name
         self.cursor.execute(sql)
+        self.install_index()
         self.connection.commit()
 
-    def get_data(self, limit=30, interval=10):
-        limit_date = datetime.now()-timedelta(days=limit)
-        sql = FETCH_DATA_SQL % {
-            'interval': interval,
-            'table_name': self.table_name,
-            'limit_date': limit_date.strftime('%Y-%m-%d'),
-        }
-
-        return self.prepare_result(self.cursor.execute(sql).fetchall())
+    def get_chart_interfaces(self, table_name, limit_timestamp):
+        """
+        Return interfaces shown on chart, self.chart_interfaces of the
+        busiest
+        """
+        return sorted(
+            row[0]
+            for row in self.cursor.execute(FETCH_INTERFACES_SQL % {
+                'table_name': table_name,
+            }, (limit_timestamp, self.chart_interfaces))
+        )
 
-    def get_chart_js(self, limit=30, interval=10):
-        column_definition = ''
-        for column_type, column_name in self.get_data_columns_description():
-            column_definition += "data.addColumn('%s', '%s');\n" % (
-                column_type, column_name,
+    def get_data(self, limit=30, interval=10, since=None):
+        table_name = self.get_rollup_table_name(interval)
+        limit_timestamp = self.get_limit_timestamp(limit, since)
+        if since is None or self.shown_keys is None:
+            self.shown_keys = self.get_chart_interfaces(
+                table_name, limit_timestamp,
             )
 
-        chart_js_string = """
-        var data = new google.visualization.DataTable();
-        %(column_definition)s
-        data.addRows(%(json_data)s);
-
-        var options = {
-          title: '%(chart_name)s'
-        };
-
-        var chart_%(table_name)s = new google.visualization.LineChart(
-            document.getElementById('chart_%(table_name)s')
-        );
-        chart_%(table_name)s.draw(data, options);
-        """
-
-        return chart_js_string % {
-            'column_definition': column_definition,
-            'table_name': self.table_name,
-            'json_data': json_dumps(self.get_data(limit, interval)),
-            'chart_name': self.chart_name
+        sql = FETCH_DATA_SQL % {
+            'step': interval * 60,
+            'table_name': table_name,
+            'placeholders': ', '.join('?' for _ in self.shown_keys),
         }
+        params = (limit_timestamp,) + tuple(self.shown_keys)
 
-    def get_chart_div(self):
-        return '<div id="chart_%s" class="chart"></div>' \
-               '<div id="chart_%s_total" class="chart"></div>' \
-               % (self.table_name, self.table_name)
+        return self.prepare_result(self.pivot(
+            self.cursor.execute(sql, params), self.shown_keys,
+        ))
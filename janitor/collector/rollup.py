@@ -0,0 +1,267 @@
+# -*- coding:utf-8 -*-
+"""
+Pre-aggregated rollup tiers of collected data
+
+Every collector table has one rollup table per tier, keyed by the start of
+the bucket. Each rollup row keeps samples count and sum, min and max of every
+collected column, so averages of any coarser interval can be computed from
+it without touching raw rows. Buckets are unix timestamps of bucket start.
+
+Collectors storing more series in one table (e.g. one row per CPU core) have
+key columns, rollup rows are then kept per bucket and key.
+"""
+import time
+
+# size of buckets in minutes, from finest to coarsest
+TIERS = (1, 10, 60)
+
+ROLLUP_TABLE_NAME = '%s_%im'
+
+CREATE_SQL = (
+    'create table if not exists %(table_name)s ('
+    '  bucket INTEGER PRIMARY KEY, '
+    '  samples INTEGER, '
+    '  %(columns)s'
+    ');'
+)
+
+CREATE_KEYED_SQL = (
+    'create table if not exists %(table_name)s ('
+    '  bucket INTEGER, '
+    '  %(keys)s, '
+    '  samples INTEGER, '
+    '  %(columns)s, '
+    '  PRIMARY KEY (bucket, %(key_names)s)'
+    ');'
+)
+
+COLUMN_SQL = '%(column)s_sum REAL, %(column)s_min REAL, %(column)s_max REAL'
+
+# bucket of given tier, calculated from raw table created_at column
+BUCKET_SQL = 'created_at / %(seconds)i * %(seconds)i'
+
+BACKFILL_SQL = (
+    'insert into %(table_name)s (bucket, %(keys)ssamples, %(columns)s) '
+    'select %(bucket)s, %(keys)scount(*), %(aggregates)s '
+    'from %(source_table_name)s '
+    'group by %(keys)s1;'
+)
+
+# the same from finer rollup table, its buckets fit evenly into coarser ones
+BACKFILL_ROLLUP_SQL = (
+    'insert into %(table_name)s (bucket, %(keys)ssamples, %(columns)s) '
+    'select bucket / %(seconds)i * %(seconds)i, %(keys)ssum(samples), '
+    '%(aggregates)s '
+    'from %(source_table_name)s '
+    'group by %(keys)s1;'
+)
+
+INSERT_SQL = (
+    'insert or ignore into %(table_name)s (bucket, %(keys)ssamples, '
+    '%(columns)s) values (?, %(key_placeholders)s0, %(placeholders)s);'
+)
+
+UPDATE_SQL = (
+    'update %(table_name)s set samples = samples + 1, %(updates)s '
+    'where bucket = ?%(key_conditions)s;'
+)
+
+SERIES_SQL = (
+    'select %(time)s / %(step)i * %(step)i, %(keys)s%(aggregates)s '
+    'from %(table_name)s '
+    'where %(time)s >= ? and %(time)s < ? '
+    'group by 1%(key_group)s '
+    'order by 1;'
+)
+
+# aggregate functions of series query, computed from raw rows
+RAW_AGGREGATES = {
+    'avg': 'avg(%(column)s)',
+    'min': 'min(%(column)s)',
+    'max': 'max(%(column)s)',
+}
+
+# the same aggregates computed from rollup rows
+ROLLUP_AGGREGATES = {
+    'avg': 'sum(%(column)s_sum) / sum(samples)',
+    'min': 'min(%(column)s_min)',
+    'max': 'max(%(column)s_max)',
+}
+
+
+def get_table_name(table_name, tier):
+    """
+    Return name of rollup table of given tier
+
+    :param table_name: Name of collector table
+    :type table_name: str
+    :param tier: Tier size in minutes
+    :type tier: int
+    :rtype: str
+    """
+    return ROLLUP_TABLE_NAME % (table_name, tier)
+
+
+def choose_tier(interval):
+    """
+    Return coarsest tier, that can answer query grouped by given interval
+
+    :param interval: Grouping interval in minutes
+    :type interval: int
+    :rtype: int
+    """
+    for tier in reversed(TIERS):
+        if interval % tier == 0:
+            return tier
+
+    return TIERS[0]
+
+
+def choose_series_tier(step):
+    """
+    Return coarsest tier, which buckets fit evenly into step of series.
+    Other steps are answered from coarsest tier with buckets not larger
+    than step, its buckets are then grouped by step start. Only steps
+    shorter than the finest bucket need raw rows.
+
+    :param step: Step of series in seconds
+    :type step: int
+    :return: Tier in minutes, None when step needs raw rows
+    :rtype: int
+    """
+    for tier in reversed(TIERS):
+        if step % (tier * 60) == 0:
+            return tier
+
+    for tier in reversed(TIERS):
+        if tier * 60 <= step:
+            return tier
+
+    return None
+
+
+def get_bucket(tier, when=None):
+    """
+    Return bucket of given tier that given unix timestamp falls into
+
+    :type tier: int
+    :type when: int
+    :rtype: int
+    """
+    seconds = tier * 60
+    when = int(time.time() if when is None else when)
+
+    return when // seconds * seconds
+
+
+def get_create_sql(table_name, columns, keys=()):
+    """
+    :param keys: Pairs of name and type of key columns
+    :type keys: tuple
+    """
+    params = {
+        'table_name': table_name,
+        'columns': ', '.join(
+            COLUMN_SQL % {'column': column} for column in columns
+        ),
+    }
+
+    if not keys:
+        return CREATE_SQL % params
+
+    params['keys'] = ', '.join('%s %s' % key for key in keys)
+    params['key_names'] = ', '.join(name for name, _ in keys)
+
+    return CREATE_KEYED_SQL % params
+
+
+def get_backfill_sql(table_name, source_table_name, columns, tier, keys=(),
+                     rollup_source=False):
+    """
+    Statement filling rollup table of given tier from collector table, or
+    from finer rollup table when ``rollup_source`` is true, which is much
+    smaller
+    """
+    if rollup_source:
+        sql = BACKFILL_ROLLUP_SQL
+        aggregates = 'sum(%(column)s_sum), min(%(column)s_min), ' \
+            'max(%(column)s_max)'
+    else:
+        sql = BACKFILL_SQL
+        aggregates = 'sum(%(column)s), min(%(column)s), max(%(column)s)'
+
+    return sql % {
+        'table_name': table_name,
+        'source_table_name': source_table_name,
+        'bucket': BUCKET_SQL % {'seconds': tier * 60},
+        'seconds': tier * 60,
+        'keys': ''.join('%s, ' % name for name, _ in keys),
+        'columns': ', '.join(
+            '%(column)s_sum, %(column)s_min, %(column)s_max' % {
+                'column': column,
+            }
+            for column in columns
+        ),
+        'aggregates': ', '.join(
+            aggregates % {'column': column} for column in columns
+        ),
+    }
+
+
+def get_insert_sql(table_name, columns, keys=()):
+    """
+    Statement creating empty rollup row, its parameters are bucket, values
+    of keys and then every value twice (initial min and max)
+    """
+    return INSERT_SQL % {
+        'table_name': table_name,
+        'keys': ''.join('%s, ' % name for name, _ in keys),
+        'key_placeholders': '?, ' * len(keys),
+        'columns': ', '.join(
+            '%(column)s_sum, %(column)s_min, %(column)s_max' % {
+                'column': column,
+            }
+            for column in columns
+        ),
+        'placeholders': ', '.join('0, ?, ?' for _ in columns),
+    }
+
+
+def get_update_sql(table_name, columns, keys=()):
+    """
+    Statement adding one sample to rollup row, its parameters are every value
+    three times (sum, min and max), then bucket and values of keys
+    """
+    return UPDATE_SQL % {
+        'table_name': table_name,
+        'updates': ', '.join(
+            '%(column)s_sum = %(column)s_sum + ?, '
+            '%(column)s_min = min(%(column)s_min, ?), '
+            '%(column)s_max = max(%(column)s_max, ?)' % {'column': column}
+            for column in columns
+        ),
+        'key_conditions': ''.join(' and %s = ?' % name for name, _ in keys),
+    }
+
+
+def get_series_sql(table_name, columns, step, aggregate, tier=None, keys=()):
+    """
+    Statement selecting series of given step from raw table (tier is None)
+    or rollup table, its parameters are start and end unix timestamps. Rows
+    are timestamp, values of keys and aggregated value of every column.
+
+    :param aggregate: One of 'avg', 'min' or 'max'
+    :type aggregate: str
+    """
+    aggregates = RAW_AGGREGATES if tier is None else ROLLUP_AGGREGATES
+
+    return SERIES_SQL % {
+        'table_name': table_name,
+        'time': 'created_at' if tier is None else 'bucket',
+        'step': step,
+        'keys': ''.join('%s, ' % name for name, _ in keys),
+        'key_group': ''.join(', %s' % name for name, _ in keys),
+        'aggregates': ', '.join(
+            aggregates[aggregate] % {'column': column} for column in columns
+        ),
+    }
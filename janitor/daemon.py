@@ -2,11 +2,20 @@
 """
 Main janitor daemon file
 """
-import time
-import sqlite3
 import signal
+import traceback
+from collections import OrderedDict
 
-from janitor.utils import Daemon
+from janitor.migrations import migrate
+from janitor.notification.base import BaseNotification
+from janitor.notification.dispatcher import Dispatcher
+from janitor.pool import Pool
+from janitor.retention import Retention
+from janitor.ringbuffer import RingBuffer
+from janitor.scheduler import Scheduler
+from janitor.stats import stats, Reporter
+from janitor.storage import connect, Storage
+from janitor.utils import Daemon, monotonic
 import config
 
 
@@ -14,35 +23,412 @@ class JanitorDaemon(Daemon):
     """
     Main janitor daemon class
     """
-    collectors = []
+    collectors = None
+    # collectors by their name in config.COLLECTORS
+    named_collectors = None
     connection = None
+    # tasks of collectors, which collect() did not finish in time
+    running = None
+    # count of skipped collections, per collector
+    skipped = None
+    # set by SIGHUP, config is reloaded before waiting for next jobs
+    reload_requested = False
 
     def __init__(self, pidfile, stdin='/dev/null', stdout='/dev/null',
                  stderr='/dev/null', working_dir='/'):
         Daemon.__init__(self, pidfile, stdin, stdout, stderr, working_dir)
-        self.connection = sqlite3.connect(config.SQLITE_PATH)
+        self.connection = connect(config.SQLITE_PATH)
+        self.storage = Storage(
+            self.connection, getattr(config, 'STORAGE_FLUSH_EVERY', 1),
+        )
+        self.retention = Retention(
+            self.connection, getattr(config, 'RETENTION', None),
+        )
 
-        # adding collectors to list
-        for name, collector in config.COLLECTORS.items():
-            collector, collector_kwargs = collector
-            self.collectors.append(
-                collector(self.connection, **collector_kwargs))
+        # threads do not survive fork of daemonize(), pool is started by run()
+        self.pool = None
+        self.reporter = Reporter(stats, getattr(config, 'STATS_PATH', None))
+        self.scheduler = None
+        self.ring_buffer = None
+        # slots of ring buffer, as it was created
+        self.ring_layouts = None
+        self.running = {}
+        self.skipped = {}
+
+        self.dispatcher = Dispatcher(
+            getattr(config, 'NOTIFICATION_QUEUE_SIZE', 1000),
+            getattr(config, 'NOTIFICATION_DIGEST_INTERVAL', 0),
+            getattr(config, 'NOTIFICATION_RETRIES', 5),
+        )
+
+        # class and arguments each collector was created with
+        self.collector_specs = {}
+        self.named_collectors = OrderedDict()
+        for name, (collector_class, collector_kwargs) in \
+                config.COLLECTORS.items():
+            self.named_collectors[name] = self.create_collector(
+                collector_class, collector_kwargs,
+            )
+            self.collector_specs[name] = self.get_spec(
+                collector_class, collector_kwargs,
+            )
+            self.attach_alerts(
+                self.named_collectors[name], collector_kwargs.get('alerts'),
+            )
+
+        self.collectors = self.named_collectors.values()
 
     def _signal_hup(self, signum, frame):
-        print 'Got HUP signal:', signum, frame
+        print 'Got HUP signal, config will be reloaded'
+        self.reload_requested = True
 
-    def run(self):
-        signal.signal(signal.SIGHUP, self._signal_hup)
+    @staticmethod
+    def get_spec(collector_class, collector_kwargs):
+        """
+        Return what collector is created from, except its alerts and
+        reconfigurable arguments, they are changed without creating
+        collector again
+        """
+        collector_kwargs = dict(
+            (name, value) for name, value in collector_kwargs.items()
+            if name != 'alerts' and
+            name not in collector_class.reconfigurable
+        )
+
+        return collector_class, collector_kwargs
+
+    def create_collector(self, collector_class, collector_kwargs):
+        return collector_class(
+            self.connection, storage=self.storage, **collector_kwargs
+        )
+
+    def attach_alerts(self, collector, alerts, previous_alerts=()):
+        """
+        Set alerts of collector, they take over state of previous alerts of
+        the same class, in order they are listed
+        """
+        collector.set_alerts(alerts)
+
+        for alert_class in set(alert.__class__ for alert in collector.alerts):
+            for alert, previous in zip(
+                    [alert for alert in collector.alerts
+                     if alert.__class__ is alert_class],
+                    [alert for alert in previous_alerts
+                     if alert.__class__ is alert_class]):
+                alert.inherit(previous)
 
+        # alerts only queue notifications, collection never waits for their
+        # delivery
+        for alert in collector.alerts:
+            alert.dispatcher = self.dispatcher
+
+    def get_notifers(self):
+        """
+        Return notifiers defined in config and the ones of alerts
+        """
+        notifers = set(
+            value for value in vars(config).itervalues()
+            if isinstance(value, BaseNotification)
+        )
         for collector in self.collectors:
+            for alert in collector.alerts:
+                notifers.update(alert.notifers)
+
+        return notifers
+
+    def retire(self, collector):
+        """
+        Close collector, which is no longer used, once its collection still
+        running on pool finishes
+        """
+        task = self.running.pop(collector, None)
+        self.skipped.pop(collector, None)
+
+        if task is None or task.is_done():
+            collector.close()
+        else:
+            def close():
+                task.wait()
+                collector.close()
+
+            self.pool.submit(close)
+
+    def get_interval(self, collector):
+        return collector.interval or config.INTERVAL
+
+    def install(self, collector):
+        with stats.timer('install.%s' % collector.table_name):
             if not collector.is_installed():
                 collector.install()
 
+            if not collector.is_rollup_installed():
+                collector.install_rollup()
+
+    def reload_config(self):
+        """
+        Read config again and apply changes of COLLECTORS in place
+
+        Collectors which class and arguments did not change are kept, with
+        their open files and state of deltas; changes of their
+        ``reconfigurable`` arguments (interval, timeout, chart settings) are
+        applied to them. Others are created, installed and scheduled,
+        removed ones are no longer scheduled. Alerts and notifiers are
+        always replaced by new ones, alerts keep state of those they
+        replace. Ring buffer is created again only when its
+        layout changes. Other settings need restart.
+        """
+        self.reload_requested = False
+        previous_notifers = self.get_notifers()
+        named_collectors = OrderedDict()
+
+        try:
+            reload(config)
+
+            collector_specs = {}
+            for name, (collector_class, collector_kwargs) in \
+                    config.COLLECTORS.items():
+                spec = self.get_spec(collector_class, collector_kwargs)
+                if spec == self.collector_specs.get(name):
+                    named_collectors[name] = self.named_collectors[name]
+                else:
+                    named_collectors[name] = self.create_collector(
+                        collector_class, collector_kwargs,
+                    )
+                collector_specs[name] = spec
+        except Exception:
+            print 'Config was not reloaded, previous one stays in use'
+            traceback.print_exc()
+            for name, collector in named_collectors.items():
+                if collector is not self.named_collectors.get(name):
+                    collector.close()
+            return
+
+        changes = OrderedDict(
+            (change, []) for change in ('added', 'changed', 'removed')
+        )
+
+        for name, collector in self.named_collectors.items():
+            if name not in named_collectors:
+                changes['removed'].append(name)
+            elif named_collectors[name] is not collector:
+                changes['changed'].append(name)
+            else:
+                continue
+
+            self.scheduler.remove(collector)
+            self.retire(collector)
+
+        for name, collector in named_collectors.items():
+            previous = self.named_collectors.get(name)
+            self.attach_alerts(
+                collector, config.COLLECTORS[name][1].get('alerts'),
+                previous.alerts if previous is not None else (),
+            )
+
+            if collector is not previous:
+                if previous is None:
+                    changes['added'].append(name)
+                self.install(collector)
+                self.scheduler.add(collector, self.get_interval(collector))
+                continue
+
+            collector.reconfigure(**dict(
+                (argument, value)
+                for argument, value in config.COLLECTORS[name][1].items()
+                if argument in collector.reconfigurable
+            ))
+            if self.scheduler.intervals[collector] != \
+                    self.get_interval(collector):
+                # interval or INTERVAL changed
+                self.scheduler.remove(collector)
+                self.scheduler.add(collector, self.get_interval(collector))
+
+        print 'Config reloaded, %s' % ', '.join(
+            '%s: %s' % (change, ', '.join(names) or '-')
+            for change, names in changes.items()
+        )
+
+        self.named_collectors = named_collectors
+        self.collector_specs = collector_specs
+        self.collectors = named_collectors.values()
+
+        # after notifications they already got
+        self.dispatcher.close(previous_notifers - self.get_notifers())
+
+        path = getattr(config, 'RING_BUFFER_PATH', None)
+        if path != (self.ring_buffer and self.ring_buffer.path) or \
+                (path and self.get_ring_layouts() != self.ring_layouts):
+            self.ring_buffer = self.create_ring_buffer()
+            if self.ring_buffer is not None:
+                # readers are not left without current values
+                self.publish(self.collectors)
+
+    def skip(self, collector, reason, counter):
+        self.skipped[collector] = self.skipped.get(collector, 0) + 1
+        stats.increment('collect.%s.%s' % (collector.table_name, counter))
+        print '%s skipped (%s), %i skips so far' % (
+            collector.__class__.__name__, reason, self.skipped[collector],
+        )
+
+    def collect(self, collectors):
+        """
+        Run collect() of given collectors concurrently on worker pool and
+        wait for each of them at most its timeout
+
+        :return: List of collectors, which finished collection in time
+        :rtype: list
+        """
+        started_at = monotonic()
+        tasks = []
+
+        for collector in collectors:
+            task = self.running.get(collector)
+            if task is not None and not task.is_done():
+                self.skip(
+                    collector, 'previous collection still running', 'skipped',
+                )
+                continue
+
+            self.running[collector] = self.pool.submit(
+                self.run_collect, collector,
+            )
+            tasks.append((collector, self.running[collector]))
+
+        collected = []
+        for collector, task in tasks:
+            timeout = collector.timeout or getattr(
+                config, 'COLLECT_TIMEOUT', config.INTERVAL,
+            )
+
+            if not task.wait(max(0, started_at + timeout - monotonic())):
+                self.skip(collector, 'timeout', 'overruns')
+                continue
+
+            del self.running[collector]
+
+            if task.error is not None:
+                traceback.print_exception(*task.error)
+                continue
+
+            collected.append(collector)
+
+        return collected
+
+    def run_collect(self, collector):
+        with stats.timer('collect.%s' % collector.table_name):
+            collector.collect()
+
+    def get_ring_layouts(self):
+        """
+        Return slots of ring buffer holding last RING_BUFFER_HOURS of samples
+        of every collector. Slots of collectors already in ring buffer are
+        kept as they are, while they have the same capacity.
+        """
+        seconds = getattr(config, 'RING_BUFFER_HOURS', 6) * 60 * 60
+        previous = dict(
+            (layout[0], layout) for layout in self.ring_layouts or ()
+        )
+        layouts = []
+
+        for collector in self.collectors:
+            capacity = int(seconds / self.get_interval(collector)) + 1
+            layout = previous.get(collector.table_name)
+
+            if layout is None or layout[1] != capacity:
+                columns = len(collector.get_series_names(
+                    collector.get_current_keys()
+                ))
+                if collector.rollup_keys:
+                    # room for series appearing later, e.g. new interfaces
+                    columns *= 2
+
+                layout = (collector.table_name, capacity, max(columns, 1))
+
+            layouts.append(layout)
+
+        return layouts
+
+    def create_ring_buffer(self):
+        """
+        Create ring buffer of the latest samples for data server
+        """
+        path = getattr(config, 'RING_BUFFER_PATH', None)
+        if not path:
+            self.ring_layouts = None
+            return None
+
+        self.ring_layouts = self.get_ring_layouts()
+
+        return RingBuffer.create(path, self.ring_layouts)
+
+    def publish(self, collectors):
+        """
+        Copy the latest samples of collectors into ring buffer
+        """
+        for collector in collectors:
+            sample = collector.get_last_sample()
+            if sample is not None:
+                self.ring_buffer.publish(collector.table_name, *sample)
+
+    def run(self):
+        signal.signal(signal.SIGHUP, self._signal_hup)
+
+        migrate(self.connection)
+
+        for collector in self.collectors:
+            self.install(collector)
+
+        self.ring_buffer = self.create_ring_buffer()
+        self.pool = Pool(getattr(config, 'COLLECT_THREADS', 4))
+        self.dispatcher.start()
+
+        self.scheduler = Scheduler()
+        for collector in self.collectors:
+            self.scheduler.add(collector, self.get_interval(collector))
+        self.scheduler.add(
+            self.retention,
+            getattr(config, 'RETENTION_INTERVAL', config.INTERVAL),
+            delay=getattr(config, 'RETENTION_INTERVAL', config.INTERVAL),
+        )
+        stats_interval = getattr(config, 'STATS_INTERVAL', 300)
+        self.scheduler.add(self.reporter, stats_interval, delay=stats_interval)
+
         while True:
-            for collector in self.collectors:
-                collector.collect()
+            if self.reload_requested:
+                self.reload_config()
+
+            due = []
+            for job, missed in self.scheduler.wait():
+                if missed:
+                    stats.increment('scheduler.missed', missed)
+                    print '%s missed %i deadline(s)' % (
+                        job.__class__.__name__, missed,
+                    )
+                due.append(job)
+
+            cycle_started = monotonic()
+            collectors = [
+                job for job in due
+                if job is not self.retention and job is not self.reporter
+            ]
+
+            collected = self.collect(collectors)
+
+            for collector in collected:
+                with stats.timer('alerts.%s' % collector.table_name):
+                    collector.check_for_alerts()
+
+            if self.ring_buffer is not None:
+                self.publish(collected)
+
+            if collectors:
+                self.storage.end_cycle()
+
+            if self.retention in due:
+                self.retention.purge(self.collectors)
 
-            for collector in self.collectors:
-                collector.check_for_alerts()
+            if collectors:
+                stats.observe('loop.cycle', monotonic() - cycle_started)
 
-            time.sleep(config.INTERVAL)
+            if self.reporter in due:
+                self.reporter.report()
@@ -0,0 +1,167 @@
+# -*- coding:utf-8 -*-
+"""
+Live updates of dashboard over Server-Sent Events
+
+Browsers keep connection to /events open. Their sockets are handed over from
+server worker to EventBroadcaster, so they do not hold workers. Single
+broadcaster thread polls ids of the latest rows of collectors, fetches new
+buckets once (through data cache) and writes the same message to every
+connected client.
+"""
+import json
+import socket
+import threading
+import time
+
+# comment sent to idle clients, so closed connections are noticed
+HEARTBEAT = ': heartbeat\n\n'
+
+
+def format_event(event, data):
+    """
+    Return Server-Sent Event with JSON data
+    """
+    return 'event: %s\ndata: %s\n\n' % (
+        event, json.dumps(data, separators=(',', ':')),
+    )
+
+
+def format_row(row):
+    """
+    Return row of chart data with datetime turned into arguments of JS Date
+    constructor, so browser interprets it the same way as chart page
+    """
+    created_at = row[0]
+
+    return [[
+        created_at.year, created_at.month - 1, created_at.day,
+        created_at.hour, created_at.minute, created_at.second,
+    ]] + list(row[1:])
+
+
+class EventBroadcaster(object):
+    """
+    Sends new rows of chart data to all connected clients
+    """
+
+    def __init__(self, worker_class, cache, limit=30, interval=10,
+                 poll_interval=5, heartbeat_interval=30, send_timeout=5):
+        """
+        :param worker_class: Factory of state (connection and collectors)
+            owned by broadcaster thread
+        :type worker_class: type
+        :type cache: janitor.cache.DataCache
+        :param limit: Days shown on chart
+        :type limit: int
+        :param interval: Minutes of chart buckets
+        :type interval: int
+        :param poll_interval: Seconds between checks for new data
+        :type poll_interval: float
+        :param heartbeat_interval: Seconds of silence before heartbeat
+        :type heartbeat_interval: float
+        :param send_timeout: Seconds client can block sending, then it is
+            dropped
+        :type send_timeout: float
+        """
+        self.worker_class = worker_class
+        self.cache = cache
+        self.limit = limit
+        self.interval = interval
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.send_timeout = send_timeout
+        self.clients = []
+        self.lock = threading.Lock()
+        # per collector table: id of the latest seen row and timestamp of the
+        # latest sent bucket
+        self.last_ids = {}
+        self.sent = {}
+        self.last_send = time.time()
+
+    def start(self):
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+
+    def add_client(self, client):
+        """
+        Take over connected socket of client, its response headers have to be
+        already sent
+        """
+        client.settimeout(self.send_timeout)
+
+        with self.lock:
+            self.clients.append(client)
+
+    def send(self, data):
+        """
+        Write data to every client, clients failing to receive it are dropped
+        """
+        with self.lock:
+            clients = list(self.clients)
+
+        failed = []
+        for client in clients:
+            try:
+                client.sendall(data)
+            except socket.error:
+                failed.append(client)
+
+        if failed:
+            with self.lock:
+                for client in failed:
+                    self.clients.remove(client)
+                    client.close()
+
+        self.last_send = time.time()
+
+    def get_messages(self, collectors):
+        """
+        Return events with rows of collectors, which got new data since last
+        call
+        """
+        messages = []
+
+        for collector in collectors:
+            table_name = collector.table_name
+            last_id = collector.get_last_id()
+            if last_id == self.last_ids.get(table_name):
+                continue
+
+            self.last_ids[table_name] = last_id
+            rows = self.cache.get_data(collector, self.limit, self.interval)
+            if not rows:
+                continue
+
+            # the latest sent bucket goes again, it was probably incomplete
+            sent = self.sent.get(table_name)
+            self.sent[table_name] = rows[-1][0]
+            if sent is None:
+                continue
+
+            messages.append(format_event('rows', {
+                'chart': table_name,
+                'columns': len(collector.column_description) + 1,
+                'rows': [format_row(row) for row in rows if row[0] >= sent],
+            }))
+
+        return messages
+
+    def run(self):
+        worker = self.worker_class()
+
+        while True:
+            time.sleep(self.poll_interval)
+
+            if not self.clients:
+                # nothing was sent to clients connecting from now on
+                self.sent = {}
+                self.last_ids = {}
+                continue
+
+            messages = self.get_messages(worker.collectors)
+
+            if messages:
+                self.send(''.join(messages))
+            elif time.time() - self.last_send >= self.heartbeat_interval:
+                self.send(HEARTBEAT)
@@ -0,0 +1,75 @@
+# -*- coding:utf-8 -*-
+"""
+Current status of collectors in Prometheus text exposition format
+
+Metrics are named janitor_<collector table>_<column>, rollup keys of
+collector (core, interface) become labels. Every collector also exposes
+timestamp of its latest sample, so stale values can be told apart.
+"""
+from collections import OrderedDict
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def escape(value, quote=True):
+    value = str(value).replace('\\', '\\\\').replace('\n', '\\n')
+    if quote:
+        value = value.replace('"', '\\"')
+
+    return value
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, escape(value)) for name, value in labels.items()
+    )
+
+
+def format_value(value):
+    return repr(float(value))
+
+
+def format_metrics(collector, created_at, status):
+    """
+    Return lines of exposition of collector status
+
+    :type collector: janitor.collector.base.BaseCollect
+    :param created_at: Unix timestamp of sample of status
+    :type created_at: int
+    :param status: Result of collector.current_status()
+    :type status: list
+    :rtype: list
+    """
+    prefix = 'janitor_%s' % collector.table_name
+    metrics = OrderedDict()
+
+    for column, labels, value in status:
+        metrics.setdefault(column, []).append((labels, value))
+
+    lines = [
+        '# HELP %s_timestamp_seconds Time of the latest sample of %s\n' % (
+            prefix, escape(collector.chart_name, False),
+        ),
+        '# TYPE %s_timestamp_seconds gauge\n' % prefix,
+        '%s_timestamp_seconds %s\n' % (prefix, format_value(created_at)),
+    ]
+
+    for column, samples in metrics.items():
+        metric_type = collector.metric_types.get(column, 'gauge')
+        name = '%s_%s' % (prefix, column)
+        if metric_type == 'counter':
+            name += '_total'
+
+        lines.append('# HELP %s %s %s\n' % (
+            name, escape(collector.chart_name, False), column,
+        ))
+        lines.append('# TYPE %s %s\n' % (name, metric_type))
+        lines.extend(
+            '%s%s %s\n' % (name, format_labels(labels), format_value(value))
+            for labels, value in samples
+        )
+
+    return lines
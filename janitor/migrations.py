@@ -0,0 +1,246 @@
+# -*- coding:utf-8 -*-
+"""
+Schema migrations of janitor database
+
+Schema version is kept in ``PRAGMA user_version``. Each migration is called
+with connection and all migrations newer than stored version are applied in
+order, when daemon starts.
+"""
+from janitor.collector import rollup
+from janitor.collector.network import (
+    INSTALL_SQL as NETWORK_INSTALL_SQL,
+    NetworkCollect,
+)
+
+NETWORK_TABLE_NAME = NetworkCollect.table_name
+
+CREATED_AT_SQL = 'created_at INTEGER DEFAULT (strftime(\'%s\', \'now\'))'
+
+
+def get_tables(cursor):
+    return [
+        row[0]
+        for row in cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND "
+            "name NOT LIKE 'sqlite_%';"
+        ).fetchall()
+    ]
+
+
+def get_columns(cursor, table_name):
+    """
+    Return list of (name, type, is_primary_key) of columns in given table
+    """
+    return [
+        (row[1], row[2], row[5])
+        for row in cursor.execute('PRAGMA table_info(%s);' % table_name)
+    ]
+
+
+def epoch_timestamps(connection):
+    """
+    Store created_at as indexed unix timestamp instead of text. Old rollup
+    tables are dropped, daemon will rebuild them from converted data.
+    """
+    cursor = connection.cursor()
+
+    for table_name in get_tables(cursor):
+        columns = get_columns(cursor, table_name)
+        column_types = dict((name, type_) for name, type_, _ in columns)
+
+        if column_types.get('bucket') == 'TIMESTAMP':
+            cursor.execute('drop table %s;' % table_name)
+            continue
+
+        if column_types.get('created_at') != 'TIMESTAMP':
+            continue
+
+        definitions = []
+        select = []
+        for name, type_, primary_key in columns:
+            if name == 'created_at':
+                definitions.append(CREATED_AT_SQL)
+                select.append('cast(strftime(\'%s\', created_at) as integer)')
+            elif primary_key:
+                definitions.append(
+                    '%s %s PRIMARY KEY AUTOINCREMENT' % (name, type_)
+                )
+                select.append(name)
+            else:
+                definitions.append('%s %s' % (name, type_))
+                select.append(name)
+
+        cursor.execute('alter table %s rename to %s_old;' % (
+            table_name, table_name,
+        ))
+        cursor.execute('create table %s (%s);' % (
+            table_name, ', '.join(definitions),
+        ))
+        cursor.execute('insert into %s (%s) select %s from %s_old;' % (
+            table_name,
+            ', '.join(name for name, _, _ in columns),
+            ', '.join(select),
+            table_name,
+        ))
+        cursor.execute('drop table %s_old;' % table_name)
+        cursor.execute(
+            'create index if not exists %(table_name)s_created_at '
+            'on %(table_name)s (created_at);' % {'table_name': table_name}
+        )
+
+
+def incremental_vacuum(connection):
+    """
+    Switch database to incremental auto vacuum, so space freed by retention
+    can be released without blocking full VACUUM. Changing the mode of
+    existing database requires one full VACUUM, which is done here once.
+    """
+    connection.commit()
+    connection.execute('PRAGMA auto_vacuum = INCREMENTAL;')
+    connection.execute('VACUUM;')
+
+
+def cpu_cores_rows(connection):
+    """
+    Store usage of every CPU core as separate row, instead of fixed cpu0 to
+    cpu7 columns. Total usage gets core -1. Rollup tables are dropped and
+    rebuilt by daemon.
+    """
+    cursor = connection.cursor()
+    tables = get_tables(cursor)
+
+    for table_name in tables:
+        columns = [name for name, _, _ in get_columns(cursor, table_name)]
+        if 'cpu' not in columns or 'cpu0' not in columns:
+            continue
+
+        cursor.execute('alter table %s rename to %s_old;' % (
+            table_name, table_name,
+        ))
+        cursor.execute('drop index if exists %s_created_at;' % table_name)
+        cursor.execute(
+            'create table %s ('
+            '  id INTEGER PRIMARY KEY AUTOINCREMENT, '
+            '  core INTEGER, '
+            '  usage REAL, '
+            '  %s'
+            ');' % (table_name, CREATED_AT_SQL)
+        )
+
+        for column in columns:
+            if not column.startswith('cpu'):
+                continue
+
+            # missing cores were stored as zeros, do not turn them into rows
+            used = cursor.execute(
+                'select count(*) from %s_old where %s != 0;' % (
+                    table_name, column,
+                )
+            ).fetchone()[0]
+            if not used and column not in ('cpu', 'cpu0'):
+                continue
+
+            core = -1 if column == 'cpu' else int(column[3:])
+            cursor.execute(
+                'insert into %(table_name)s (core, usage, created_at) '
+                'select %(core)i, %(column)s, created_at '
+                'from %(table_name)s_old '
+                'where %(column)s is not null '
+                'order by id;' % {
+                    'table_name': table_name,
+                    'column': column,
+                    'core': core,
+                }
+            )
+
+        cursor.execute('drop table %s_old;' % table_name)
+        cursor.execute(
+            'create index %(table_name)s_created_at '
+            'on %(table_name)s (created_at);' % {'table_name': table_name}
+        )
+
+        for tier in rollup.TIERS:
+            cursor.execute('drop table if exists %s;' % rollup.get_table_name(
+                table_name, tier,
+            ))
+
+
+def network_interfaces_rows(connection):
+    """
+    Move data of per interface network_<interface>_usage tables into single
+    network_usage table with interface column. Old tables and their rollups
+    are dropped, rollups of new table are built by daemon.
+    """
+    cursor = connection.cursor()
+    tables = get_tables(cursor)
+    counters = (
+        'rx_bytes, tx_bytes, rx_packets, tx_packets, rx_bytes_delta, '
+        'tx_bytes_delta, rx_packets_delta, tx_packets_delta, created_at'
+    )
+
+    old_tables = [
+        table_name
+        for table_name in tables
+        if table_name.startswith('network_') and
+        table_name.endswith('_usage') and
+        table_name != NETWORK_TABLE_NAME
+    ]
+    if not old_tables:
+        return
+
+    if NETWORK_TABLE_NAME not in tables:
+        cursor.execute(NETWORK_INSTALL_SQL % NETWORK_TABLE_NAME)
+        cursor.execute(
+            'create index %(table_name)s_created_at '
+            'on %(table_name)s (created_at);' % {
+                'table_name': NETWORK_TABLE_NAME,
+            }
+        )
+
+    for table_name in old_tables:
+        cursor.execute(
+            'insert into %(new_table)s (interface, %(counters)s) '
+            'select ?, %(counters)s from %(old_table)s order by id;' % {
+                'new_table': NETWORK_TABLE_NAME,
+                'old_table': table_name,
+                'counters': counters,
+            },
+            (table_name[len('network_'):-len('_usage')],)
+        )
+        cursor.execute('drop table %s;' % table_name)
+
+        for tier in rollup.TIERS:
+            cursor.execute('drop table if exists %s;' % rollup.get_table_name(
+                table_name, tier,
+            ))
+
+    for tier in rollup.TIERS:
+        cursor.execute('drop table if exists %s;' % rollup.get_table_name(
+            NETWORK_TABLE_NAME, tier,
+        ))
+
+
+MIGRATIONS = (
+    epoch_timestamps,
+    incremental_vacuum,
+    cpu_cores_rows,
+    network_interfaces_rows,
+)
+
+
+def migrate(connection):
+    """
+    Apply all not yet applied migrations
+
+    :type connection: sqlite3.Connection
+    """
+    cursor = connection.cursor()
+    version = cursor.execute('PRAGMA user_version;').fetchone()[0]
+
+    for number, migration in enumerate(MIGRATIONS, 1):
+        if number <= version:
+            continue
+
+        migration(connection)
+        cursor.execute('PRAGMA user_version = %i;' % number)
+        connection.commit()
@@ -23,3 +23,9 @@ class BaseNotification(object):
         :rtype:
         """
         pass
+
+    def close(self):
+        """
+        Release resources of notifier, it is not used after config reload
+        """
+        pass
@@ -0,0 +1,159 @@
+# -*- coding:utf-8 -*-
+"""
+Delivery of notifications outside of collection loop
+
+Alerts put notifications into bounded queue and return immediately. Single
+dispatcher thread delivers them, so slow or unreachable mail server never
+delays collection. Notifications arriving within digest interval are
+delivered together, notifiers with send_digest() get them as one message.
+Failed deliveries are retried with exponential backoff.
+"""
+import threading
+import time
+import traceback
+import Queue
+
+from janitor.utils import monotonic
+
+# queued in place of message, notifier is closed when it is dispatched
+CLOSE = object()
+
+
+class Dispatcher(object):
+    """
+    Queue of notifications delivered by background thread
+    """
+
+    def __init__(self, size=1000, digest_interval=0, retries=5, backoff=1,
+                 max_backoff=300):
+        """
+        :param size: Max count of waiting notifications, newer ones are
+            dropped when queue is full
+        :type size: int
+        :param digest_interval: Seconds notifications are gathered after
+            the first one, before they are delivered together
+        :type digest_interval: float
+        :param retries: Count of repeated attempts of failed delivery
+        :type retries: int
+        :param backoff: Seconds before the first retry, doubled with each
+            next one
+        :type backoff: float
+        :param max_backoff: Max seconds between retries
+        :type max_backoff: float
+        """
+        self.queue = Queue.Queue(size)
+        self.digest_interval = digest_interval
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.dropped = 0
+
+    def start(self):
+        thread = threading.Thread(
+            target=self.run, name='janitor-notifications',
+        )
+        thread.daemon = True
+        thread.start()
+
+    def submit(self, notifer, sender, message):
+        """
+        Queue notification, it is dropped when queue is full
+
+        :return: Was notification queued?
+        :rtype: bool
+        """
+        try:
+            self.queue.put_nowait((notifer, str(sender), message))
+        except Queue.Full:
+            self.dropped += 1
+            print 'Notification queue is full, %i dropped so far: %s' % (
+                self.dropped, message,
+            )
+            return False
+
+        return True
+
+    def close(self, notifers):
+        """
+        Close notifiers once notifications queued before are delivered
+        """
+        for notifer in notifers:
+            try:
+                self.queue.put_nowait((notifer, None, CLOSE))
+            except Queue.Full:
+                # the rest is closed when garbage collected
+                return
+
+    def get_batch(self):
+        """
+        Wait for notification and return it with the ones arriving within
+        digest interval
+        """
+        batch = [self.queue.get()]
+        deadline = monotonic() + self.digest_interval
+
+        while True:
+            timeout = deadline - monotonic()
+            if timeout <= 0:
+                break
+
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except Queue.Empty:
+                break
+
+        return batch
+
+    def deliver(self, func, *args):
+        """
+        Call func, retrying with backoff when it raises
+
+        :return: Was it delivered?
+        :rtype: bool
+        """
+        for attempt in xrange(self.retries + 1):
+            try:
+                func(*args)
+                return True
+            except Exception:
+                traceback.print_exc()
+
+            if attempt < self.retries:
+                time.sleep(min(self.backoff * 2 ** attempt, self.max_backoff))
+
+        print 'Notification was not delivered after %i attempts' % (
+            self.retries + 1,
+        )
+        return False
+
+    def dispatch(self, batch):
+        """
+        Deliver batch of notifications, grouped by notifier
+        """
+        notifers = []
+        notifications = {}
+
+        for notifer, sender, message in batch:
+            if notifer not in notifications:
+                notifers.append(notifer)
+                notifications[notifer] = []
+            notifications[notifer].append((sender, message))
+
+        for notifer in notifers:
+            items = notifications[notifer]
+            closing = (None, CLOSE) in items
+            if closing:
+                items = [item for item in items if item[1] is not CLOSE]
+
+            if len(items) > 1 and hasattr(notifer, 'send_digest'):
+                self.deliver(notifer.send_digest, items)
+            else:
+                for sender, message in items:
+                    self.deliver(notifer.send_notification, sender, message)
+
+            if closing:
+                notifer.close()
+
+    def run(self):
+        while True:
+            self.dispatch(self.get_batch())
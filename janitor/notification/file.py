@@ -21,3 +21,6 @@ class SimpleFileNotification(BaseNotification):
         )
 
         self.file.flush()
+
+    def close(self):
+        self.file.close()
@@ -1,32 +1,102 @@
 # -*- coding:utf-8 -*-
 import smtplib
+import socket
 from email.mime.text import MIMEText
 
+from janitor.utils import monotonic
 from .base import BaseNotification
 
 
 class EmailNotification(BaseNotification):
     """
-    Log notifications into simple file
+    Send notifications by email
+
+    SMTP session is kept open between notifications, it is opened again when
+    it was idle longer than ``keep_alive`` config (60 seconds by default) or
+    server closed it.
     """
     def __init__(self, config):
         self.config = config
+        self.server = None
+        self.used_at = None
 
-    def send_notification(self, sender, message):
-        msg = MIMEText("Sender: %s" % sender)
+    def connect(self):
+        server = smtplib.SMTP(
+            self.config['host'], self.config['port'],
+            timeout=self.config.get('timeout', 30),
+        )
+        server.ehlo()
+        if self.config.get('use_tls', True):
+            server.starttls()
+            server.ehlo()
+        if self.config.get('user'):
+            server.login(self.config['user'], self.config['password'])
+
+        return server
 
-        msg['Subject'] = "Notification: %s" % message
+    def close(self):
+        if self.server is None:
+            return
+
+        try:
+            self.server.quit()
+        except (smtplib.SMTPException, socket.error):
+            # quit() closes socket only when server answers
+            self.server.close()
+        self.server = None
+
+    def send(self, subject, body):
+        msg = MIMEText(body)
+
+        msg['Subject'] = subject
         if 'from' in self.config:
             msg['From'] = self.config['from']
         msg['To'] = self.config['receiver']
 
-        server = smtplib.SMTP(self.config['host'], self.config['port'])
-        server.ehlo()
-        server.starttls()
-        server.login(self.config['user'], self.config['password'])
-        server.sendmail(
-            self.config['user'],
+        if self.server is not None and \
+                monotonic() - self.used_at > self.config.get('keep_alive', 60):
+            self.close()
+
+        try:
+            if self.server is None:
+                self.server = self.connect()
+                self.sendmail(msg)
+            else:
+                try:
+                    self.sendmail(msg)
+                except (smtplib.SMTPServerDisconnected, socket.error):
+                    # server closed reused session meanwhile
+                    self.close()
+                    self.server = self.connect()
+                    self.sendmail(msg)
+        except Exception:
+            # state of session is unknown, next email opens new one
+            self.close()
+            raise
+
+        self.used_at = monotonic()
+
+    def sendmail(self, msg):
+        self.server.sendmail(
+            self.config.get('user') or self.config.get('from'),
             self.config['receiver'],
             msg.as_string(),
         )
-        server.quit()
+
+    def send_notification(self, sender, message):
+        self.send("Notification: %s" % message, "Sender: %s" % sender)
+
+    def send_digest(self, notifications):
+        """
+        Send more notifications in one email
+
+        :param notifications: Pairs of sender and message
+        :type notifications: list
+        """
+        self.send(
+            "Notifications: %i alerts" % len(notifications),
+            '\n'.join(
+                "%s: %s" % (sender, message)
+                for sender, message in notifications
+            ),
+        )
@@ -0,0 +1,75 @@
+# -*- coding:utf-8 -*-
+"""
+Small bounded pool of worker threads
+"""
+import sys
+import threading
+import Queue
+
+
+class Task(object):
+    """
+    Function submitted to pool, with its outcome
+    """
+
+    def __init__(self, func, args=()):
+        self.func = func
+        self.args = args
+        self.result = None
+        self.error = None
+        self.finished = threading.Event()
+
+    def run(self):
+        try:
+            self.result = self.func(*self.args)
+        except Exception:
+            self.error = sys.exc_info()
+        finally:
+            self.finished.set()
+
+    def is_done(self):
+        return self.finished.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Wait until task is done, at most timeout seconds
+
+        :return: Is task done?
+        :rtype: bool
+        """
+        self.finished.wait(timeout)
+
+        return self.finished.is_set()
+
+
+class Pool(object):
+    """
+    Runs submitted tasks on fixed number of daemon threads
+    """
+
+    def __init__(self, size=4):
+        self.queue = Queue.Queue()
+        self.workers = []
+
+        for number in range(size):
+            worker = threading.Thread(
+                target=self.work, name='janitor-worker-%i' % number,
+            )
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def work(self):
+        while True:
+            self.queue.get().run()
+
+    def submit(self, func, *args):
+        """
+        Queue function to be called by one of workers
+
+        :rtype: Task
+        """
+        task = Task(func, args)
+        self.queue.put(task)
+
+        return task
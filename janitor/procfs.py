@@ -0,0 +1,209 @@
+# -*- coding:utf-8 -*-
+"""
+Readers of /proc files used by collectors
+
+Every reader keeps its file descriptor open for whole life of collector and
+reads file from its beginning into reusable buffer (os.pread is missing in
+Python 2, so it is seek and readinto). Content is then copied once into str
+and parsed by str methods: parsing the buffer in place (bytearray.split,
+int() of its slices, per field assignments) is slower in CPython 2. Only
+fields collector needs are converted, results are kept in arrays reused by
+next read, collectors copy what they keep.
+"""
+import io
+import os
+from array import array
+
+PROC_ROOT = '/proc'
+
+# user, nice, system, idle, iowait, irq, softirq, steal, guest, guest_nice
+STAT_FIELDS = 10
+
+STAT_IDLE = 3
+
+MEMINFO_FIELDS = (
+    'SwapTotal', 'SwapFree', 'MemTotal', 'MemFree', 'Buffers', 'Cached',
+)
+
+
+class ProcFile(object):
+    """
+    File in /proc read always as a whole, from its beginning
+    """
+
+    def __init__(self, name, root=PROC_ROOT, size=4096):
+        """
+        :param name: Path of file, relative to root
+        :type name: str
+        :param root: Mount point of procfs, can be changed for tests
+        :type root: str
+        :param size: Initial size of buffer, it grows when file is larger
+        :type size: int
+        """
+        self.path = os.path.join(root, name)
+        self.file = io.FileIO(self.path, 'r')
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+
+    def fill(self):
+        """
+        Read whole file into buffer
+
+        :return: Count of read bytes
+        :rtype: int
+        """
+        while True:
+            self.file.seek(0)
+            size = self.file.readinto(self.buffer)
+
+            if size < len(self.buffer):
+                return size
+
+            self.buffer = bytearray(len(self.buffer) * 2)
+            self.view = memoryview(self.buffer)
+
+    def read_bytes(self):
+        """
+        Read whole file into buffer and return copy of its content as str
+        """
+        return self.view[:self.fill()].tobytes()
+
+    def close(self):
+        self.file.close()
+
+
+class StatReader(ProcFile):
+    """
+    Reads CPU times from /proc/stat
+
+    After read(), ``times`` holds STAT_FIELDS counters of total cpu followed
+    by counters of every core, ``cores`` is count of cores. ``times`` grows
+    only with count of cores, counters of every line are converted by one
+    map(int) into temporary array and assigned into its slice, which is
+    faster than assigning them one by one.
+    """
+
+    def __init__(self, root=PROC_ROOT):
+        super(StatReader, self).__init__('stat', root)
+        self.cores = 0
+        self.times = array('L')
+
+    def read(self):
+        content = self.read_bytes()
+        times = self.times
+        row = 0
+
+        # cpu lines are always at the beginning of /proc/stat
+        for line in content.split('\n'):
+            if not line.startswith('cpu'):
+                break
+
+            fields = line.split()[1:STAT_FIELDS + 1]
+            offset = row * STAT_FIELDS
+
+            if len(times) < offset + STAT_FIELDS:
+                times.extend([0] * STAT_FIELDS)
+
+            # older kernels expose less counters, missing ones stay zero
+            times[offset:offset + len(fields)] = array('L', map(int, fields))
+            row += 1
+
+        if len(times) > row * STAT_FIELDS:
+            del times[row * STAT_FIELDS:]
+
+        self.cores = row - 1
+
+        return times
+
+
+class MeminfoReader(ProcFile):
+    """
+    Reads MEMINFO_FIELDS values (in kB) from /proc/meminfo into ``values``
+    """
+
+    def __init__(self, root=PROC_ROOT, fields=MEMINFO_FIELDS):
+        super(MeminfoReader, self).__init__('meminfo', root)
+        self.fields = dict(
+            (field + ':', index) for index, field in enumerate(fields)
+        )
+        self.values = array('L', [0] * len(fields))
+
+    def read(self):
+        content = self.read_bytes()
+        values = self.values
+        missing = len(self.fields)
+
+        for line in content.split('\n'):
+            name, _, rest = line.partition(' ')
+            index = self.fields.get(name)
+
+            if index is None:
+                continue
+
+            values[index] = int(rest.split(None, 1)[0])
+            missing -= 1
+
+            if not missing:
+                break
+
+        return values
+
+
+class LoadavgReader(ProcFile):
+    """
+    Reads 1, 5 and 15 minutes load averages from /proc/loadavg
+    """
+
+    def __init__(self, root=PROC_ROOT):
+        super(LoadavgReader, self).__init__('loadavg', root, 128)
+
+    def read(self):
+        la1, la5, la15, _ = self.read_bytes().split(' ', 3)
+
+        return float(la1), float(la5), float(la15)
+
+
+class NetDevReader(ProcFile):
+    """
+    Reads counters of network interfaces from /proc/net/dev
+
+    After read(), ``counters`` maps interface name to array of rx bytes,
+    tx bytes, rx packets and tx packets. Interfaces, which disappeared, are
+    removed.
+    """
+
+    def __init__(self, root=PROC_ROOT):
+        super(NetDevReader, self).__init__('net/dev', root)
+        self.counters = {}
+
+    def read(self):
+        content = self.read_bytes()
+        counters = self.counters
+        # first two lines are header
+        lines = content.split('\n')[2:]
+
+        seen = set()
+
+        for line in lines:
+            interface, _, stats = line.partition(':')
+            if not stats:
+                continue
+
+            interface = interface.strip()
+            seen.add(interface)
+            stats = stats.split()
+            values = counters.get(interface)
+
+            if values is None:
+                values = counters[interface] = array('L', [0] * 4)
+
+            values[0] = int(stats[0])
+            values[1] = int(stats[8])
+            values[2] = int(stats[1])
+            values[3] = int(stats[9])
+
+        if len(seen) != len(counters):
+            for interface in set(counters) - seen:
+                del counters[interface]
+
+        return counters
@@ -0,0 +1,148 @@
+# -*- coding:utf-8 -*-
+"""
+Removing old data from janitor database
+
+Retention policy is a dict mapping ``'raw'`` (collector table) or rollup tier
+size in minutes to number of days data is kept. ``None`` means forever.
+"""
+import time
+
+from janitor.collector import rollup
+
+DEFAULT_POLICY = {
+    'raw': 2,
+    1: 7,
+    10: 90,
+    60: None,
+}
+
+DELETE_SQL = (
+    'delete from %(table_name)s where rowid in ('
+    '  select rowid from %(table_name)s where %(column)s < ? limit %(limit)i'
+    ');'
+)
+
+
+class Retention(object):
+    """
+    Purges expired rows in small batches, and gives freed pages back to the
+    file system with incremental vacuum
+    """
+
+    def __init__(self, connection, policy=None, batch_size=500,
+                 vacuum_pages=256):
+        """
+        :type connection: sqlite3.Connection
+        :param policy: Default retention policy for all collectors
+        :type policy: dict
+        :param batch_size: Max rows deleted in one transaction
+        :type batch_size: int
+        :param vacuum_pages: Max pages freed by one incremental vacuum
+        :type vacuum_pages: int
+        """
+        self.connection = connection
+        self.cursor = connection.cursor()
+        self.policy = dict(DEFAULT_POLICY)
+        self.policy.update(policy or {})
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        # table purge() starts with, see purge()
+        self.next_table = None
+
+    def get_policy(self, collector):
+        """
+        Return retention policy of given collector, merged with default one
+        """
+        policy = dict(self.policy)
+        policy.update(getattr(collector, 'retention', None) or {})
+
+        return policy
+
+    def get_tables(self, collector):
+        """
+        Return list of (table name, time column, days) of tables, which have
+        limited retention
+        """
+        policy = self.get_policy(collector)
+        tables = []
+
+        if policy.get('raw') is not None:
+            tables.append((collector.table_name, 'created_at', policy['raw']))
+
+        for tier in rollup.TIERS:
+            if policy.get(tier) is not None:
+                tables.append((
+                    rollup.get_table_name(collector.table_name, tier),
+                    'bucket',
+                    policy[tier],
+                ))
+
+        return tables
+
+    def purge_batch(self, table_name, column, days):
+        """
+        Delete one batch of expired rows from given table
+
+        :return: Count of deleted rows
+        :rtype: int
+        """
+        limit = int(time.time()) - days * 24 * 60 * 60
+        self.cursor.execute(DELETE_SQL % {
+            'table_name': table_name,
+            'column': column,
+            'limit': self.batch_size,
+        }, (limit,))
+        self.connection.commit()
+
+        return self.cursor.rowcount
+
+    def vacuum(self):
+        """
+        Release part of free pages, if there are any
+        """
+        free_pages = self.cursor.execute('PRAGMA freelist_count;').fetchone()
+        if free_pages[0]:
+            self.cursor.execute(
+                'PRAGMA incremental_vacuum(%i);' % self.vacuum_pages
+            ).fetchall()
+
+    def purge(self, collectors, max_batches=10):
+        """
+        Delete at most max_batches batches of expired rows from tables of
+        given collectors. Meant to be called between collection cycles.
+
+        Tables are visited round-robin, call starts by the table after the
+        one, which used up the last batch of previous call, so table with
+        large backlog does not starve the others. Batch deleting nothing is
+        not counted.
+
+        :return: Count of deleted rows
+        :rtype: int
+        """
+        tables = [
+            table
+            for collector in collectors
+            for table in self.get_tables(collector)
+        ]
+        names = [table_name for table_name, _, _ in tables]
+        if self.next_table in names:
+            start = names.index(self.next_table)
+            tables = tables[start:] + tables[:start]
+
+        deleted = 0
+
+        for index, (table_name, column, days) in enumerate(tables):
+            count = self.batch_size
+            while max_batches > 0 and count == self.batch_size:
+                count = self.purge_batch(table_name, column, days)
+                deleted += count
+                if count:
+                    max_batches -= 1
+
+            if max_batches <= 0:
+                self.next_table = tables[(index + 1) % len(tables)][0]
+                break
+
+        self.vacuum()
+
+        return deleted
@@ -0,0 +1,419 @@
+# -*- coding:utf-8 -*-
+"""
+Memory-mapped ring buffer of recent samples, shared by daemon and data server
+
+Daemon is the only writer, it publishes every stored sample of collector to
+the collector's slot. Data server maps the same file read-only and answers
+short range queries and current values without touching SQLite.
+
+File layout (little endian)::
+
+    header      magic, version, count of slots
+    slots       SLOT for every collector
+    names       per slot, max_columns names of series, newline separated
+    records     per slot, capacity records of timestamp and max_columns
+                values, all doubles; missing values are NaN
+
+Every slot has its own sequence counter (seqlock). Writer makes it odd
+before changing the slot and even again after. Reader copies what it needs
+and accepts the copy only when the counter was even and did not change
+meanwhile, otherwise it tries again.
+"""
+import math
+import mmap
+import os
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+
+MAGIC = 'JRB1'
+
+VERSION = 1
+
+HEADER = struct.Struct('<4sII')
+
+# name, sequence, head (count of written records), capacity (records),
+# max_columns, columns, offset of names, offset of records
+SLOT = struct.Struct('<32sQQIIIQQ')
+
+SEQUENCE = struct.Struct('<Q')
+SEQUENCE_OFFSET = 32
+
+HEAD = struct.Struct('<Q')
+HEAD_OFFSET = 40
+
+COLUMNS = struct.Struct('<I')
+COLUMNS_OFFSET = 56
+
+# bytes reserved for name of one series
+NAME_SIZE = 64
+
+NAN = float('nan')
+
+# reader gives up after so many copies changed by writer meanwhile
+READ_ATTEMPTS = 100
+
+
+class Slot(object):
+    """
+    Position of collector data in file
+    """
+
+    def __init__(self, offset, name, capacity, max_columns, names_offset,
+                 records_offset):
+        self.offset = offset
+        self.name = name
+        self.capacity = capacity
+        self.max_columns = max_columns
+        self.names_offset = names_offset
+        self.records_offset = records_offset
+        self.record = struct.Struct('<%id' % (max_columns + 1))
+        # names written by last publish, only writer uses it
+        self.names = None
+
+
+class RingBuffer(object):
+    """
+    Ring buffer file, created by daemon with create(), opened by readers
+    with RingBuffer(path)
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Path of ring buffer file
+        :type path: str
+        """
+        self.path = path
+        self.buffer = None
+        self.inode = None
+        self.slots = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def create(cls, path, layouts):
+        """
+        Create new ring buffer file, replacing existing one, and return it
+        opened for writing
+
+        :param layouts: Tuples of slot name, capacity (count of records) and
+            max count of series
+        :type layouts: list
+        :rtype: RingBuffer
+        """
+        offset = HEADER.size + SLOT.size * len(layouts)
+        slots = []
+
+        for name, capacity, max_columns in layouts:
+            names_offset = offset
+            records_offset = names_offset + NAME_SIZE * max_columns
+            offset = records_offset + 8 * (max_columns + 1) * capacity
+            slots.append(
+                (name, capacity, max_columns, names_offset, records_offset)
+            )
+
+        temporary_path = '%s.%i' % (path, os.getpid())
+        with open(temporary_path, 'wb') as ring_file:
+            ring_file.truncate(offset)
+            ring_file.write(HEADER.pack(MAGIC, VERSION, len(layouts)))
+
+            for name, capacity, max_columns, names_offset, records_offset \
+                    in slots:
+                ring_file.write(SLOT.pack(
+                    name, 0, 0, capacity, max_columns, 0, names_offset,
+                    records_offset,
+                ))
+
+        # readers never see half written header
+        os.rename(temporary_path, path)
+
+        ring_buffer = cls(path)
+        ring_buffer.open(writable=True)
+
+        return ring_buffer
+
+    def open(self, writable=False):
+        """
+        Map the file, if it was not mapped yet or was replaced by daemon
+
+        :return: False when file does not exist or is not valid
+        :rtype: bool
+        """
+        try:
+            inode = os.stat(self.path).st_ino
+        except OSError:
+            return False
+
+        if inode == self.inode:
+            return True
+
+        with self.lock:
+            if inode == self.inode:
+                return True
+
+            with open(self.path, 'r+b' if writable else 'rb') as ring_file:
+                try:
+                    buf = mmap.mmap(
+                        ring_file.fileno(), 0,
+                        access=mmap.ACCESS_WRITE if writable
+                        else mmap.ACCESS_READ,
+                    )
+                except ValueError:
+                    # empty file
+                    return False
+
+            magic, version, count = HEADER.unpack_from(buf)
+            if magic != MAGIC or version != VERSION:
+                buf.close()
+                return False
+
+            slots = {}
+            for index in xrange(count):
+                offset = HEADER.size + SLOT.size * index
+                name, _, _, capacity, max_columns, _, names_offset, \
+                    records_offset = SLOT.unpack_from(buf, offset)
+                name = name.rstrip('\0')
+                slots[name] = Slot(
+                    offset, name, capacity, max_columns, names_offset,
+                    records_offset,
+                )
+
+            self.buffer, self.inode, self.slots = buf, inode, slots
+
+        return True
+
+    def publish(self, name, created_at, values):
+        """
+        Append sample to slot of given name, values which do not fit into
+        slot are dropped. When names of series change, older records of slot
+        are discarded.
+
+        :param created_at: Unix timestamp of sample
+        :type created_at: int
+        :param values: Values of series by their names
+        :type values: collections.OrderedDict
+        """
+        slot = self.slots.get(name)
+        if slot is None:
+            return
+
+        buf = self.buffer
+        names = values.keys()[:slot.max_columns]
+        record = [created_at] + [
+            NAN if value is None else value
+            for value in values.values()[:slot.max_columns]
+        ]
+        record.extend([NAN] * (slot.max_columns + 1 - len(record)))
+
+        sequence_offset = slot.offset + SEQUENCE_OFFSET
+        head_offset = slot.offset + HEAD_OFFSET
+        sequence = SEQUENCE.unpack_from(buf, sequence_offset)[0]
+        head = HEAD.unpack_from(buf, head_offset)[0]
+
+        SEQUENCE.pack_into(buf, sequence_offset, sequence + 1)
+
+        if names != slot.names:
+            text = '\n'.join(names)[:NAME_SIZE * slot.max_columns]
+            buf[slot.names_offset:slot.names_offset + len(text)] = text
+            buf[
+                slot.names_offset + len(text):
+                slot.names_offset + NAME_SIZE * slot.max_columns
+            ] = '\0' * (NAME_SIZE * slot.max_columns - len(text))
+            COLUMNS.pack_into(buf, slot.offset + COLUMNS_OFFSET, len(names))
+
+            if slot.names is not None:
+                head = 0
+            slot.names = names
+
+        slot.record.pack_into(
+            buf,
+            slot.records_offset + slot.record.size * (head % slot.capacity),
+            *record
+        )
+        HEAD.pack_into(buf, head_offset, head + 1)
+
+        SEQUENCE.pack_into(buf, sequence_offset, sequence + 2)
+
+    def find(self, slot, first, head, since):
+        """
+        Return position of the first record since given unix timestamp,
+        records are ordered by time, so it is binary search
+        """
+        width = slot.record.size
+        low, high = first, head
+
+        while low < high:
+            middle = (low + high) // 2
+            created_at = struct.unpack_from(
+                '<d', self.buffer,
+                slot.records_offset + width * (middle % slot.capacity),
+            )[0]
+
+            if created_at < since:
+                low = middle + 1
+            else:
+                high = middle
+
+        return low
+
+    def copy(self, slot, first, head):
+        """
+        Return bytes of records from first to head position
+        """
+        width = slot.record.size
+        start = first % slot.capacity
+        count = head - first
+
+        if start + count <= slot.capacity:
+            offset = slot.records_offset + width * start
+            return self.buffer[offset:offset + width * count]
+
+        # records wrap around end of slot
+        offset = slot.records_offset + width * start
+        return self.buffer[
+            offset:slot.records_offset + width * slot.capacity
+        ] + self.buffer[
+            slot.records_offset:
+            slot.records_offset + width * (count - slot.capacity + start)
+        ]
+
+    def read(self, name, since=None, last=None):
+        """
+        Return names of series and rows of timestamp and values, from the
+        oldest record, or the first one since given unix timestamp, or only
+        ``last`` records
+
+        :return: None when slot is missing or could not be read consistently
+        :rtype: tuple
+        """
+        if not self.open():
+            return None
+
+        slot = self.slots.get(name)
+        if slot is None:
+            return None
+
+        buf = self.buffer
+        sequence_offset = slot.offset + SEQUENCE_OFFSET
+
+        for _ in xrange(READ_ATTEMPTS):
+            sequence = SEQUENCE.unpack_from(buf, sequence_offset)[0]
+            if sequence % 2:
+                continue
+
+            head = HEAD.unpack_from(buf, slot.offset + HEAD_OFFSET)[0]
+            columns = COLUMNS.unpack_from(
+                buf, slot.offset + COLUMNS_OFFSET,
+            )[0]
+            names = buf[
+                slot.names_offset:
+                slot.names_offset + NAME_SIZE * slot.max_columns
+            ]
+
+            first = max(0, head - slot.capacity)
+            if last is not None:
+                first = max(first, head - last)
+            if since is not None:
+                first = self.find(slot, first, head, since)
+            records = self.copy(slot, first, head)
+
+            if SEQUENCE.unpack_from(buf, sequence_offset)[0] == sequence:
+                break
+        else:
+            return None
+
+        names = names.rstrip('\0').split('\n')[:columns] if columns else []
+        values = array('d')
+        values.fromstring(records)
+        width = slot.max_columns + 1
+        rows = []
+
+        for start in xrange(0, len(values), width):
+            rows.append([int(values[start])] + [
+                None if math.isnan(value) else value
+                for value in values[start + 1:start + 1 + columns]
+            ])
+
+        return names, rows
+
+    def get_oldest(self, name):
+        """
+        Return unix timestamp of the oldest record of slot, None when slot
+        is empty or missing
+        """
+        if not self.open():
+            return None
+
+        slot = self.slots.get(name)
+        if slot is None:
+            return None
+
+        buf = self.buffer
+        sequence_offset = slot.offset + SEQUENCE_OFFSET
+
+        for _ in xrange(READ_ATTEMPTS):
+            sequence = SEQUENCE.unpack_from(buf, sequence_offset)[0]
+            if sequence % 2:
+                continue
+
+            head = HEAD.unpack_from(buf, slot.offset + HEAD_OFFSET)[0]
+            first = max(0, head - slot.capacity) % slot.capacity
+            created_at = struct.unpack_from(
+                '<d', buf, slot.records_offset + slot.record.size * first,
+            )[0]
+
+            if SEQUENCE.unpack_from(buf, sequence_offset)[0] == sequence:
+                return int(created_at) if head else None
+
+        return None
+
+    def get_latest(self, name):
+        """
+        Return unix timestamp and ordered dict of values of the latest
+        sample of slot, None when there is none
+        """
+        result = self.read(name, last=1)
+        if not result or not result[1]:
+            return None
+
+        names, rows = result
+
+        return rows[-1][0], OrderedDict(zip(names, rows[-1][1:]))
+
+    def get_series(self, name, start, end, step, aggregate='avg'):
+        """
+        Return the same as BaseCollect.get_series() computed from records,
+        None when ring buffer does not reach back to start
+        """
+        oldest = self.get_oldest(name)
+        if oldest is None or oldest > start:
+            return None
+
+        result = self.read(name, since=start)
+        if result is None:
+            return None
+
+        names, rows = result
+        buckets = OrderedDict()
+        for row in rows:
+            if start <= row[0] < end:
+                buckets.setdefault(row[0] // step * step, []).append(row)
+
+        columns = OrderedDict((column, []) for column in names)
+        for index, values in enumerate(columns.values(), 1):
+            for bucket_rows in buckets.values():
+                present = [
+                    row[index] for row in bucket_rows
+                    if row[index] is not None
+                ]
+
+                if not present:
+                    values.append(None)
+                elif aggregate == 'min':
+                    values.append(min(present))
+                elif aggregate == 'max':
+                    values.append(max(present))
+                else:
+                    values.append(sum(present) / float(len(present)))
+
+        return 'ring', buckets.keys(), columns
@@ -0,0 +1,82 @@
+# -*- coding:utf-8 -*-
+"""
+Scheduler of periodic jobs, driven by monotonic clock
+"""
+import heapq
+import itertools
+import time
+
+from janitor.utils import monotonic
+
+
+class Scheduler(object):
+    """
+    Keeps heap of next deadlines of jobs. Deadlines are calculated from
+    previous deadline, not from the moment job was done, so periods do not
+    drift with time spent on the job itself.
+    """
+
+    def __init__(self, clock=monotonic, sleep=time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self.queue = []
+        self.intervals = {}
+        # tie breaker, jobs themselves are not comparable
+        self.counter = itertools.count()
+
+    def add(self, job, interval, delay=0):
+        """
+        Schedule job to be run every interval seconds, first time after
+        delay seconds
+
+        :type interval: float
+        :type delay: float
+        """
+        self.intervals[job] = interval
+        heapq.heappush(
+            self.queue, (self.clock() + delay, next(self.counter), job),
+        )
+
+    def remove(self, job):
+        """
+        Stop scheduling given job
+        """
+        self.intervals.pop(job, None)
+        self.queue = [entry for entry in self.queue if entry[2] is not job]
+        heapq.heapify(self.queue)
+
+    def pop_due(self):
+        """
+        Return list of (job, missed) of all jobs, which deadline has passed,
+        and schedule their next runs. ``missed`` is count of whole periods
+        that passed since deadline, those runs are skipped, not caught up.
+
+        :rtype: list
+        """
+        now = self.clock()
+        due = []
+
+        while self.queue and self.queue[0][0] <= now:
+            deadline, _, job = heapq.heappop(self.queue)
+            interval = self.intervals[job]
+            missed = int((now - deadline) // interval)
+            due.append((job, missed))
+
+            heapq.heappush(self.queue, (
+                deadline + (missed + 1) * interval, next(self.counter), job,
+            ))
+
+        return due
+
+    def wait(self):
+        """
+        Sleep until next deadline and return due jobs, see pop_due()
+
+        :rtype: list
+        """
+        if self.queue:
+            delay = self.queue[0][0] - self.clock()
+            if delay > 0:
+                self.sleep(delay)
+
+        return self.pop_due()
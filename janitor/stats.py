@@ -0,0 +1,201 @@
+# -*- coding:utf-8 -*-
+"""
+Self-instrumentation of janitor processes
+
+Durations of hot paths (collect, install, storage commit, alert evaluation,
+HTTP request) go into fixed-bucket histograms, events like overruns and
+errors into counters. Recording is a bisect and few additions under lock, so
+it can stay on all the time. Every process has its own ``stats``: daemon
+prints summary line and dumps it to STATS_PATH periodically, data server
+returns both its own and daemon's on /stats.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from janitor.utils import monotonic
+
+# upper bounds of histogram buckets, in seconds
+BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1, 2.5, 5, 10, 30,
+)
+
+
+class Histogram(object):
+    """
+    Counts of durations in fixed buckets, with their count, sum and max
+    """
+
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        # the last bucket counts durations over the last bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """
+        Return upper bound of bucket containing quantile q (0 to 1), max of
+        durations for the last bucket, None when empty
+        """
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+
+        return self.max
+
+    def as_dict(self):
+        return OrderedDict((
+            ('count', self.count),
+            ('sum', self.total),
+            ('mean', self.total / self.count if self.count else None),
+            ('p50', self.quantile(0.5)),
+            ('p99', self.quantile(0.99)),
+            ('max', self.max),
+            ('buckets', OrderedDict(
+                ('%g' % bound, count)
+                for bound, count in zip(self.bounds + ('+Inf',), self.counts)
+                if count
+            )),
+        ))
+
+
+class Timer(object):
+    """
+    Context manager recording duration of its block into histogram
+    """
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+        self.started = None
+
+    def __enter__(self):
+        self.started = monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.stats.observe(self.name, monotonic() - self.started)
+        if exc_type is not None:
+            self.stats.increment('%s.errors' % self.name)
+
+
+class Stats(object):
+    """
+    Named histograms and counters, shared by threads of process
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+
+    def observe(self, name, seconds):
+        """
+        Record duration into histogram of given name
+        """
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name, count=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + count
+
+    def timer(self, name):
+        """
+        Return context manager timing its block, block raising is also
+        counted in ``<name>.errors`` counter
+        """
+        return Timer(self, name)
+
+    def snapshot(self):
+        """
+        Return all stats as ordered dict, ready to be serialized to JSON
+        """
+        with self.lock:
+            return OrderedDict((
+                ('pid', os.getpid()),
+                ('timestamp', int(time.time())),
+                ('uptime', int(time.time() - self.started_at)),
+                ('counters', OrderedDict(sorted(self.counters.items()))),
+                ('histograms', OrderedDict(
+                    (name, histogram.as_dict())
+                    for name, histogram in sorted(self.histograms.items())
+                )),
+            ))
+
+    def format_line(self):
+        """
+        Return one line summary: count, median and max duration of every
+        histogram and non-zero counters
+        """
+        with self.lock:
+            parts = [
+                '%s n=%i p50=%.1fms max=%.1fms' % (
+                    name, histogram.count,
+                    histogram.quantile(0.5) * 1000, histogram.max * 1000,
+                )
+                for name, histogram in sorted(self.histograms.items())
+            ] + [
+                '%s=%i' % (name, count)
+                for name, count in sorted(self.counters.items()) if count
+            ]
+
+        return 'stats: %s' % '; '.join(parts)
+
+    def dump(self, path):
+        """
+        Write snapshot as JSON to file, readers never see half written file
+        """
+        temporary_path = '%s.%i' % (path, os.getpid())
+        with open(temporary_path, 'w') as stats_file:
+            json.dump(self.snapshot(), stats_file)
+
+        os.rename(temporary_path, path)
+
+
+class Reporter(object):
+    """
+    Job of daemon printing and dumping its stats
+    """
+
+    def __init__(self, stats, path=None):
+        """
+        :type stats: Stats
+        :param path: File stats are dumped to, for data server
+        :type path: str
+        """
+        self.stats = stats
+        self.path = path
+
+    def report(self):
+        print self.stats.format_line()
+
+        if self.path:
+            self.stats.dump(self.path)
+
+
+# stats of current process
+stats = Stats()
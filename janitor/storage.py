@@ -0,0 +1,112 @@
+# -*- coding:utf-8 -*-
+"""
+Access to janitor database
+"""
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from janitor.stats import stats
+
+
+def connect(path):
+    """
+    Open connection to janitor database in WAL mode, so data server can read
+    while daemon writes
+
+    :param path: Path to SQLite database
+    :type path: str
+    :rtype: sqlite3.Connection
+    """
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA journal_mode = WAL;').fetchall()
+    connection.execute('PRAGMA synchronous = NORMAL;')
+
+    return connection
+
+
+def connect_readonly(path):
+    """
+    Open connection to janitor database, which refuses any writes. Used by
+    data server, each of its workers has own connection.
+
+    :param path: Path to SQLite database
+    :type path: str
+    :rtype: sqlite3.Connection
+    """
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA query_only = ON;')
+
+    return connection
+
+
+class Storage(object):
+    """
+    Gathers writes of all collectors and saves them in one transaction, once
+    per ``flush_every`` collection cycles. Writes can be queued from any
+    thread, flush must be called from thread owning connection.
+    """
+
+    def __init__(self, connection, flush_every=1):
+        """
+        :type connection: sqlite3.Connection
+        :param flush_every: Count of cycles written in one transaction
+        :type flush_every: int
+        """
+        self.connection = connection
+        self.flush_every = flush_every
+        self.cycles = 0
+        self.lock = threading.Lock()
+        # statements are executed in order of their first appearance, rows
+        # of the same statement are written with single executemany
+        self.pending = OrderedDict()
+
+    def write(self, sql, params):
+        """
+        Queue one row to be written with given parameterized statement
+
+        :type sql: str
+        :type params: tuple
+        """
+        with self.lock:
+            self.pending.setdefault(sql, []).append(params)
+
+    def write_many(self, writes):
+        """
+        Queue list of (sql, params) writes at once, so they are always
+        flushed in the same transaction
+
+        :type writes: list
+        """
+        with self.lock:
+            for sql, params in writes:
+                self.pending.setdefault(sql, []).append(params)
+
+    def end_cycle(self):
+        """
+        Mark end of collection cycle, flush if enough cycles are gathered
+        """
+        self.cycles += 1
+
+        if self.cycles >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all queued rows in one transaction
+        """
+        with self.lock:
+            pending, self.pending = self.pending, OrderedDict()
+            self.cycles = 0
+
+        if not pending:
+            return
+
+        with stats.timer('storage.commit'):
+            with self.connection:
+                for sql, rows in pending.items():
+                    self.connection.executemany(sql, rows)
+
+        stats.increment(
+            'storage.rows', sum(len(rows) for rows in pending.values()),
+        )
@@ -0,0 +1,321 @@
+# -*- coding:utf-8 -*-
+"""
+Generator of synthetic history of samples, for load testing and benchmarks
+
+Tables are created by collectors themselves, so generated database has the
+same schema as one written by daemon, including rollup tables, and daemon
+or data server can be pointed to it directly. Samples follow daily cycle
+with noise and occasional spikes: CPU usage and load average share the same
+activity, network traffic follows it too, counters only grow.
+
+Rows are written with bulk-insert settings: no journal and no sync, index
+on created_at is created after insert and rollup tables are backfilled by
+single query each. Database is switched to WAL at the end.
+"""
+import argparse
+import math
+import os
+import random
+import sqlite3
+import time
+from array import array
+from itertools import izip
+
+from janitor.collector import (
+    MemoryCollect,
+    CPULoadCollect,
+    LoadAverageCollect,
+    NetworkCollect,
+)
+from janitor.collector.cpu import INSERT_SQL as CPU_INSERT_SQL, TOTAL
+from janitor.collector.load_average import (
+    INSERT_SQL as LOAD_AVERAGE_INSERT_SQL,
+)
+from janitor.collector.memory import INSERT_SQL as MEMORY_INSERT_SQL
+from janitor.collector.network import INSERT_SQL as NETWORK_INSERT_SQL
+from janitor.migrations import MIGRATIONS
+from janitor.procfs import PROC_ROOT
+
+# settings of connection while rows are inserted
+BULK_PRAGMAS = (
+    'PRAGMA journal_mode = OFF;',
+    'PRAGMA synchronous = OFF;',
+    'PRAGMA locking_mode = EXCLUSIVE;',
+    'PRAGMA temp_store = MEMORY;',
+    'PRAGMA cache_size = -262144;',
+)
+
+# total memory of generated host, in kB as in /proc/meminfo
+MEMORY_TOTAL = 16 * 1024 * 1024
+SWAP_TOTAL = 4 * 1024 * 1024
+
+# average traffic of interface at peak hours, bytes per second
+PEAK_TRAFFIC = 2 * 1024 * 1024
+
+PACKET_SIZE = 900
+
+# rows inserted by one executemany
+BATCH_SIZE = 100000
+
+
+class HistoryGenerator(object):
+    """
+    Produces rows of collector tables for every sample time between start
+    and end
+    """
+
+    def __init__(self, start, end, interval=55, cores=4, interfaces=2,
+                 seed=None):
+        """
+        :param start: Unix timestamp of the first sample
+        :type start: int
+        :param end: Unix timestamp after the last sample
+        :type end: int
+        :param interval: Seconds between samples
+        :type interval: int
+        :param cores: Count of CPU cores
+        :type cores: int
+        :param interfaces: Count of network interfaces, named eth0, eth1...
+        :type interfaces: int
+        :param seed: Seed of random generator, for repeatable history
+        :type seed: int
+        """
+        self.timestamps = xrange(start, end, interval)
+        self.interval = interval
+        self.cores = cores
+        self.interfaces = ['eth%i' % index for index in xrange(interfaces)]
+        self.random = random.Random(seed)
+        self.activity = self.get_activity()
+
+    def get_activity(self):
+        """
+        Return activity of host (0 to 1) in every sample time: daily cycle
+        peaking in the afternoon, slower weekly cycle, noise and spikes
+        """
+        rand = self.random.random
+        activity = array('d')
+        spike = 0.0
+
+        for created_at in self.timestamps:
+            day = (created_at % 86400) / 86400.0
+            week = (created_at % 604800) / 604800.0
+            value = 0.35 - 0.25 * math.cos(2 * math.pi * (day - 0.1)) + \
+                0.05 * math.sin(2 * math.pi * week) + 0.1 * (rand() - 0.5)
+
+            # short incident, fading out
+            if rand() < 0.001:
+                spike = 0.5 + 0.5 * rand()
+            value += spike
+            spike *= 0.8
+
+            activity.append(min(max(value, 0.0), 1.0))
+
+        return activity
+
+    def cpu_rows(self):
+        """
+        Rows of CPULoadCollect: core, usage, created_at
+        """
+        rand = self.random.random
+        # busier cores stay busier
+        weights = [0.5 + rand() for _ in xrange(self.cores)]
+
+        for created_at, activity in izip(self.timestamps, self.activity):
+            usages = [
+                min(100.0, max(0.0, activity * weight * 100 +
+                               (rand() - 0.5) * 10))
+                for weight in weights
+            ]
+            yield TOTAL, round(sum(usages) / len(usages), 2), created_at
+
+            for core, usage in enumerate(usages):
+                yield core, round(usage, 2), created_at
+
+    def load_average_rows(self):
+        """
+        Rows of LoadAverageCollect: la1, la5, la15, created_at
+        """
+        decay = [
+            math.exp(-self.interval / (minutes * 60.0))
+            for minutes in (1, 5, 15)
+        ]
+        loads = [0.0, 0.0, 0.0]
+
+        rand = self.random.random
+
+        for created_at, activity in izip(self.timestamps, self.activity):
+            running = activity * self.cores * (0.8 + 0.4 * rand())
+            loads = [
+                load * factor + running * (1 - factor)
+                for load, factor in zip(loads, decay)
+            ]
+            yield tuple(round(load, 2) for load in loads) + (created_at,)
+
+    def memory_rows(self):
+        """
+        Rows of MemoryCollect: total, free, buffers, cache, swap total, swap
+        used, created_at
+        """
+        rand = self.random.random
+        cache = MEMORY_TOTAL * 0.3
+
+        for created_at, activity in izip(self.timestamps, self.activity):
+            used = MEMORY_TOTAL * (0.2 + 0.5 * activity)
+            # page cache grows slowly, until memory is needed
+            cache = min(cache * 1.001 + 1024, MEMORY_TOTAL - used)
+            buffers = MEMORY_TOTAL * 0.02 * (1 + rand())
+            free = max(MEMORY_TOTAL - used - cache - buffers, 0)
+            swap_used = SWAP_TOTAL * max(activity - 0.8, 0)
+
+            yield (
+                MEMORY_TOTAL, int(free), int(buffers), int(cache),
+                SWAP_TOTAL, int(swap_used), created_at,
+            )
+
+    def network_rows(self):
+        """
+        Rows of NetworkCollect: interface, counters, deltas, created_at
+        """
+        rand = self.random.random
+        # first interface carries the most traffic
+        shares = [1.0 / (index + 1) for index in xrange(len(self.interfaces))]
+        counters = dict(
+            (interface, [0, 0, 0, 0]) for interface in self.interfaces
+        )
+
+        for created_at, activity in izip(self.timestamps, self.activity):
+            for interface, share in zip(self.interfaces, shares):
+                rx = int(PEAK_TRAFFIC * share * activity * self.interval *
+                         (0.5 + rand()))
+                tx = int(rx * (0.2 + 0.3 * rand()))
+                deltas = (rx, tx, rx // PACKET_SIZE, tx // PACKET_SIZE)
+
+                values = counters[interface]
+                for index, delta in enumerate(deltas):
+                    values[index] += delta
+
+                yield (interface,) + tuple(values) + deltas + (created_at,)
+
+    def get_tables(self):
+        """
+        Return list of (collector class, insert statement, rows)
+        """
+        return [
+            (CPULoadCollect, CPU_INSERT_SQL, self.cpu_rows()),
+            (MemoryCollect, MEMORY_INSERT_SQL, self.memory_rows()),
+            (LoadAverageCollect, LOAD_AVERAGE_INSERT_SQL,
+             self.load_average_rows()),
+            (NetworkCollect, NETWORK_INSERT_SQL, self.network_rows()),
+        ]
+
+
+def insert_rows(connection, sql, rows):
+    """
+    Insert rows in batches, return their count
+    """
+    count = 0
+    batch = []
+
+    for row in rows:
+        batch.append(row)
+
+        if len(batch) >= BATCH_SIZE:
+            connection.executemany(sql, batch)
+            count += len(batch)
+            batch = []
+
+    connection.executemany(sql, batch)
+
+    return count + len(batch)
+
+
+def generate(connection, days, interval=55, cores=4, interfaces=2,
+             seed=None, end=None, verbose=False, proc_root=PROC_ROOT):
+    """
+    Fill empty database with ``days`` of samples ending now (or ``end``)
+
+    :type connection: sqlite3.Connection
+    :param proc_root: Mount point of procfs collectors open to create
+        tables, recorded files to run without real host
+    :type proc_root: str
+    :return: Count of inserted rows by table name
+    :rtype: dict
+    """
+    end = int(time.time() if end is None else end)
+    generator = HistoryGenerator(
+        end - int(days * 24 * 60 * 60), end, interval, cores, interfaces, seed,
+    )
+
+    # mode of daemon database, it has to be set before the first table
+    connection.execute('PRAGMA auto_vacuum = INCREMENTAL;')
+    for pragma in BULK_PRAGMAS:
+        connection.execute(pragma).fetchall()
+
+    counts = {}
+    for collector_class, sql, rows in generator.get_tables():
+        started_at = time.time()
+        collector = collector_class(connection, proc_root=proc_root)
+
+        collector.install()
+        collector.cursor.execute(
+            'drop index %s_created_at;' % collector.table_name
+        )
+
+        with connection:
+            counts[collector.table_name] = insert_rows(
+                connection, sql % collector.table_name, rows,
+            )
+
+        collector.install_index()
+        collector.install_rollup()
+        collector.close()
+
+        if verbose:
+            print '%s: %i rows in %.1fs' % (
+                collector.table_name, counts[collector.table_name],
+                time.time() - started_at,
+            )
+
+    # schema is current, daemon must not migrate it
+    connection.execute('PRAGMA user_version = %i;' % len(MIGRATIONS))
+    connection.execute('PRAGMA locking_mode = NORMAL;')
+    connection.execute('PRAGMA journal_mode = WAL;').fetchall()
+
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate synthetic history of janitor samples',
+    )
+    parser.add_argument('path', help='path of created database')
+    parser.add_argument(
+        '--days', type=float, default=365,
+        help='days of history (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--interval', type=int, default=55,
+        help='seconds between samples (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--cores', type=int, default=4,
+        help='count of CPU cores (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--interfaces', type=int, default=2,
+        help='count of network interfaces (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--seed', type=int, default=None, help='seed of random generator',
+    )
+    args = parser.parse_args()
+
+    if os.path.exists(args.path):
+        parser.error('%s already exists' % args.path)
+
+    started_at = time.time()
+    counts = generate(
+        sqlite3.connect(args.path), args.days, args.interval, args.cores,
+        args.interfaces, args.seed, verbose=True,
+    )
+    print '%i rows in %.1fs' % (sum(counts.values()), time.time() - started_at)
@@ -5,20 +5,88 @@ import os
 import time
 import atexit
 import json
-import re
+import ctypes
+import ctypes.util
 from signal import SIGTERM
 
+CLOCK_MONOTONIC = 1
+
+
+# formatted Javascript dates, the same chart rows are serialized repeatedly
+__js_dates__ = {}
+
+__JS_DATES_SIZE__ = 65536
+
+
+def __not_serializable__(obj):
+    raise TypeError('%r is not JSON serializable' % (obj,))
+
+
+def __get_json_encode__():
+    """
+    Return function encoding values without dates with compact separators,
+    C encoder is built once, so it is cheap to call per chart row. Its
+    constructor is private and its arguments differ between Python versions,
+    public JSONEncoder is used when it is missing or does not fit.
+    """
+    encoder = json.JSONEncoder(
+        separators=(',', ':'), default=__not_serializable__,
+        check_circular=False,
+    )
+    c_make_encoder = getattr(json.encoder, 'c_make_encoder', None)
+
+    if c_make_encoder is None:
+        return encoder.encode
+
+    try:
+        c_encode = c_make_encoder(
+            None, __not_serializable__, json.encoder.encode_basestring_ascii,
+            None, ':', ',', False, False, True,
+        )
+    except TypeError:
+        return encoder.encode
+
+    def encode(obj):
+        return ''.join(c_encode(obj, 0))
+
+    return encode
+
+
+__json_encode__ = __get_json_encode__()
 
-class __JSONDateEncoder__(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, datetime):
-            return '**new Date(%i,%i,%i,%i,%i,%i)' % (
-                obj.year, obj.month-1, obj.day,
-                obj.hour, obj.minute, obj.second,
-            )
-        if isinstance(obj, date):
-            return '**new Date(%i,%i,%i)' % (obj.year, obj.month-1, obj.day)
-        return json.JSONEncoder.default(self, obj)
+
+class __Timespec__(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+def __get_monotonic__():
+    """
+    Return monotonic clock function, time.monotonic is missing in Python 2,
+    so clock_gettime from libc is used there
+    """
+    if hasattr(time, 'monotonic'):
+        return time.monotonic
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        clock_gettime = libc.clock_gettime
+    except (OSError, AttributeError):
+        return time.time
+
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(__Timespec__)]
+
+    def monotonic():
+        timespec = __Timespec__()
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.pointer(timespec)) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+        return timespec.tv_sec + timespec.tv_nsec * 1e-9
+
+    return monotonic
+
+
+monotonic = __get_monotonic__()
 
 
 class Singleton(type):
@@ -170,14 +238,126 @@ class Daemon(object):
         """
 
 
+def __js_date__(obj):
+    """
+    Return Javascript Date literal of datetime or date
+    """
+    literal = __js_dates__.get(obj)
+    if literal is not None:
+        return literal
+
+    if isinstance(obj, datetime):
+        literal = 'new Date(%i,%i,%i,%i,%i,%i)' % (
+            obj.year, obj.month - 1, obj.day,
+            obj.hour, obj.minute, obj.second,
+        )
+    else:
+        literal = 'new Date(%i,%i,%i)' % (obj.year, obj.month - 1, obj.day)
+
+    if len(__js_dates__) >= __JS_DATES_SIZE__:
+        __js_dates__.clear()
+    __js_dates__[obj] = literal
+
+    return literal
+
+
+def __json_encode_dates__(obj):
+    """
+    Return JSON of obj with dates written as Javascript Date literals.
+    Values without dates are encoded by C encoder at once, rows starting
+    with date (chart data) have only the date formatted in Python.
+    """
+    if isinstance(obj, date):
+        return __js_date__(obj)
+
+    if isinstance(obj, (list, tuple)) and obj and isinstance(obj[0], date):
+        if len(obj) == 1:
+            return '[%s]' % __js_date__(obj[0])
+
+        try:
+            return '[%s,%s' % (
+                __js_date__(obj[0]), __json_encode__(obj[1:])[1:],
+            )
+        except TypeError:
+            pass
+    else:
+        try:
+            return __json_encode__(obj)
+        except TypeError:
+            pass
+
+    if isinstance(obj, (list, tuple)):
+        return '[%s]' % ','.join(__json_encode_dates__(item) for item in obj)
+
+    if isinstance(obj, dict):
+        return '{%s}' % ','.join(
+            '%s:%s' % (
+                __json_encode__(unicode(key)), __json_encode_dates__(value),
+            )
+            for key, value in obj.iteritems()
+        )
+
+    __not_serializable__(obj)
+
+
+def __iter_json__(obj):
+    """
+    Yield parts of JSON of obj, items of dicts and lists of containers (e.g.
+    chart rows) are yielded separately
+    """
+    if isinstance(obj, dict):
+        yield '{'
+        for index, (key, value) in enumerate(obj.iteritems()):
+            yield '%s%s:' % (
+                index and ',' or '', __json_encode__(unicode(key)),
+            )
+            for part in __iter_json__(value):
+                yield part
+        yield '}'
+    elif isinstance(obj, (list, tuple)) and obj and \
+            isinstance(obj[0], (list, tuple, dict)):
+        yield '['
+        for index, item in enumerate(obj):
+            if index:
+                yield ','
+            yield __json_encode_dates__(item)
+        yield ']'
+    else:
+        yield __json_encode_dates__(obj)
+
+
+def json_iterdumps(obj, chunk_size=64 * 1024):
+    """
+    Serialize obj like json_dumps(), yielding output in chunks of about
+    chunk_size bytes, so large payloads can be streamed to socket
+
+    @param obj: the python object to serialize
+    @param chunk_size: minimal size of yielded chunk, except the last one
+    """
+    chunk = []
+    size = 0
+
+    for part in __iter_json__(obj):
+        chunk.append(part)
+        size += len(part)
+
+        if size >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+
+    if chunk:
+        yield ''.join(chunk)
+
+
 def json_dumps(obj):
     """ A (simple)json wrapper that can wrap up python datetime and date
     objects into Javascript date objects.
     @param obj: the python object (possibly containing dates or datetimes) for
         (simple)json to serialize into JSON
 
-    @returns: JSON version of the passed object
+    @returns: JSON version of the passed object, dates are written directly
+        as Javascript Date literals in one pass. It is ASCII only str, not
+        unicode as before, so it can be written to sockets without encoding
     """
-    __jsdateregexp__ = re.compile(r'"\*\*(new Date\([0-9,]+\))"')
-    out = __jsdateregexp__.sub(r'\1', json.dumps(obj, cls=__JSONDateEncoder__))
-    return unicode(out).decode('utf-8')
+    return __json_encode_dates__(obj)
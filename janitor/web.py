@@ -0,0 +1,660 @@
+# -*- coding:utf-8 -*-
+"""
+HTTP server of janitor dashboard
+
+Requests are handled by fixed pool of worker threads. Every worker has own
+read-only connection to database and own collector instances, so a slow
+client or large chart holds only its worker. Connections are kept alive
+(HTTP/1.1) for ``JANITOR_DATA_KEEP_ALIVE`` seconds, idle ones are watched by
+single thread and passed to workers only when next request arrives.
+"""
+import BaseHTTPServer
+import gzip
+import json
+import os
+import Queue
+import select
+import socket
+import sys
+import threading
+import time
+import urlparse
+import zlib
+from collections import OrderedDict
+from cStringIO import StringIO
+
+from janitor.cache import DataCache
+from janitor.chart.downsample import DEFAULT_POINTS
+from janitor.collector import rollup
+from janitor.events import EventBroadcaster
+from janitor.metrics import CONTENT_TYPE, format_metrics
+from janitor.retention import DEFAULT_POLICY
+from janitor.ringbuffer import RingBuffer
+from janitor.stats import stats
+from janitor.storage import connect_readonly
+from janitor.utils import json_dumps, json_iterdumps, monotonic
+import config
+
+# the most points series API returns in one response
+MAX_SERIES_POINTS = 10000
+
+SERIES_AGGREGATES = ('avg', 'min', 'max')
+
+CHART_POINTS = getattr(config, 'CHART_POINTS', DEFAULT_POINTS)
+
+RETENTION_POLICY = dict(DEFAULT_POLICY)
+RETENTION_POLICY.update(getattr(config, 'RETENTION', None) or {})
+
+# days and minutes of buckets shown on dashboard
+CHART_LIMIT = 30
+CHART_INTERVAL = 10
+
+# smaller responses are not worth compressing
+GZIP_MIN_SIZE = 1024
+
+PAGE_HTML = """<html>
+  <head>
+    <script type="text/javascript" src="https://www.google.com/jsapi"></script>
+    <script type="text/javascript">
+      google.load("visualization", "1", {packages:["corechart"]});
+      google.setOnLoadCallback(drawChart);
+      var charts = {};
+      function drawChart() {
+        %s
+        listen();
+      }
+      // append rows pushed by server, instead of reloading whole page
+      function listen() {
+        if (!window.EventSource) {
+          return;
+        }
+        var source = new EventSource('/events');
+        source.addEventListener('rows', function (event) {
+          var message = JSON.parse(event.data),
+              chart = charts[message.chart];
+          if (!chart) {
+            return;
+          }
+          if (chart.data.getNumberOfColumns() != message.columns) {
+            // server shows other series now
+            window.location.reload();
+            return;
+          }
+          var rows = message.rows.map(function (row) {
+            var d = row[0];
+            row[0] = new Date(d[0], d[1], d[2], d[3], d[4], d[5]);
+            return row;
+          });
+          // buckets sent again replace the ones chart already has
+          var last = chart.data.getNumberOfRows() - 1;
+          while (last >= 0 && rows.length &&
+                 chart.data.getValue(last, 0) >= rows[0][0]) {
+            chart.data.removeRow(last--);
+          }
+          chart.data.addRows(rows);
+          chart.chart.draw(chart.data, chart.options);
+        });
+      }
+    </script>
+    <style>
+    div.chart{max-width: 1200px; height: 500px; margin: 9 auto;}
+    </style>
+  </head>
+  <body>
+    %s
+  </body>
+</html>
+"""
+
+
+def gzip_compress(data):
+    """
+    Return data compressed to gzip format, the same data gives the same bytes
+    """
+    buf = StringIO()
+    gzip_file = gzip.GzipFile(fileobj=buf, mode='wb', mtime=0)
+    gzip_file.write(data)
+    gzip_file.close()
+
+    return buf.getvalue()
+
+
+class Page(object):
+    """
+    Rendered dashboard, kept until new data is collected
+    """
+
+    def __init__(self, etag, body):
+        self.etag = etag
+        self.body = body
+        self.compressed = gzip_compress(body)
+
+
+class Worker(object):
+    """
+    State owned by one thread of server
+    """
+
+    def __init__(self):
+        self.connection = connect_readonly(config.SQLITE_PATH)
+        self.collectors = []
+
+        for name, collector in config.COLLECTORS.items():
+            collector, collector_kwargs = collector
+            self.collectors.append(
+                collector(self.connection, **collector_kwargs)
+            )
+
+        # collectors are found by name in config or by table name
+        self.collectors_by_name = dict(
+            (collector.table_name, collector) for collector in self.collectors
+        )
+        self.collectors_by_name.update(zip(
+            config.COLLECTORS.keys(), self.collectors,
+        ))
+
+
+class ChartHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Handles requests of one client connection, path is dispatched to method
+    named in ``routes``
+    """
+    protocol_version = 'HTTP/1.1'
+
+    # unbuffered, so pipelined requests are left in socket, see handle()
+    rbufsize = 0
+
+    # seconds of waiting for the rest of started request
+    timeout = getattr(config, 'JANITOR_DATA_KEEP_ALIVE', 15)
+
+    routes = {
+        '/': 'get_page',
+        '/api/series': 'get_series',
+        '/events': 'get_events',
+        '/api/current': 'get_current',
+        '/stats': 'get_stats',
+        '/metrics': 'get_metrics',
+    }
+
+    # set when connection was handed over to other thread and must stay open
+    detached = False
+
+    @property
+    def worker(self):
+        return self.server.local.worker
+
+    def handle(self):
+        """
+        Handle request and requests already received after it, then hand
+        kept alive connection over to server, so idle client does not hold
+        worker
+        """
+        self.close_connection = 1
+        self.handle_one_request()
+
+        while not self.close_connection and self.is_readable():
+            self.handle_one_request()
+
+        if not self.close_connection and not self.detached:
+            self.detached = True
+            self.server.idle.add(self.request, self.client_address)
+
+    def is_readable(self):
+        """
+        Return True when next request (e.g. pipelined one) was already
+        received
+        """
+        poll = select.poll()
+        poll.register(self.connection, select.POLLIN)
+
+        return bool(poll.poll(0))
+
+    def do_GET(self):
+        url = urlparse.urlsplit(self.path)
+        method = self.routes.get(url.path)
+
+        if method is None:
+            stats.increment('http.not_found')
+            self.send_error(404)
+            return
+
+        with stats.timer('http.%s' % method):
+            getattr(self, method)(urlparse.parse_qs(url.query))
+
+    do_HEAD = do_GET
+
+    def accepts_gzip(self):
+        return 'gzip' in self.headers.get('Accept-Encoding', '')
+
+    def is_not_modified(self, etag):
+        """
+        Check if client has current version of resource with given ETag
+        """
+        if_none_match = self.headers.get('If-None-Match')
+        if not if_none_match:
+            return False
+
+        return if_none_match.strip() == '*' or etag in (
+            tag.strip() for tag in if_none_match.split(',')
+        )
+
+    def send_not_modified(self, etag):
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.end_headers()
+
+    def send_body(self, body, content_type='text/html; charset=utf-8',
+                  status=200, headers=None, compressed=None):
+        """
+        Send complete response, Content-Length keeps connection reusable.
+        Large bodies are gzipped for clients accepting it.
+
+        :param compressed: Already gzipped body
+        :type compressed: str
+        """
+        if isinstance(body, unicode):
+            body = body.encode('utf-8')
+
+        headers = dict(headers or {})
+        if len(body) >= GZIP_MIN_SIZE:
+            headers['Vary'] = 'Accept-Encoding'
+
+            if self.accepts_gzip():
+                body = compressed or gzip_compress(body)
+                headers['Content-Encoding'] = 'gzip'
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def send_stream(self, chunks, content_type, status=200, headers=None):
+        """
+        Send response of unknown length as it is produced, with chunked
+        transfer encoding; gzipped for clients accepting it
+        """
+        compressor = None
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('Vary', 'Accept-Encoding')
+        if self.accepts_gzip():
+            compressor = zlib.compressobj(
+                6, zlib.DEFLATED, 16 + zlib.MAX_WBITS,
+            )
+            self.send_header('Content-Encoding', 'gzip')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        if self.command == 'HEAD':
+            return
+
+        for chunk in chunks:
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            self.write_chunk(chunk)
+
+        if compressor is not None:
+            self.write_chunk(compressor.flush())
+        self.wfile.write('0\r\n\r\n')
+
+    def write_chunk(self, data):
+        if data:
+            self.wfile.write('%x\r\n%s\r\n' % (len(data), data))
+
+    def send_json(self, data, status=200):
+        self.send_body(json_dumps(data), 'application/json', status)
+
+    def get_page_etag(self):
+        """
+        Return ETag of dashboard, made of ids of the latest rows of all
+        collectors, it changes whenever new sample is written
+        """
+        return 'W/"%s"' % '-'.join(
+            str(collector.get_last_id() or 0)
+            for collector in self.worker.collectors
+        )
+
+    def render_page(self):
+        chart_divs = chart_jses = ''
+
+        for collector in self.worker.collectors:
+            chart_jses += collector.get_chart_js(
+                CHART_LIMIT, CHART_INTERVAL, CHART_POINTS, self.server.cache,
+            )
+            chart_divs += collector.get_chart_div()
+
+        return (PAGE_HTML % (chart_jses, chart_divs)).encode('utf-8')
+
+    def get_page(self, query):
+        etag = self.get_page_etag()
+
+        if self.is_not_modified(etag):
+            self.send_not_modified(etag)
+            return
+
+        page = self.server.page
+        if page is None or page.etag != etag:
+            page = self.server.page = Page(etag, self.render_page())
+
+        self.send_body(page.body, headers={
+            'ETag': etag,
+            # browser has to ask every time, mostly it gets 304
+            'Cache-Control': 'no-cache',
+        }, compressed=page.compressed)
+
+    def get_events(self, query):
+        """
+        Stream of new chart rows, connection is handed over to broadcaster
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.close_connection = 1
+
+        if self.command == 'HEAD':
+            return
+
+        # browser reconnects after this many milliseconds, when connection
+        # is lost
+        self.wfile.write('retry: 10000\n\n')
+        self.wfile.flush()
+        self.detached = True
+        self.server.events.add_client(self.request)
+
+    def get_current(self, query):
+        """
+        The latest sample of one collector, read from ring buffer
+
+        Parameters: collector (name from config or table name).
+        """
+        collector = self.worker.collectors_by_name.get(
+            query.get('collector', [None])[0]
+        )
+        if collector is None:
+            self.send_json({'error': 'unknown collector'}, 400)
+            return
+
+        latest = None
+        if self.server.ring_buffer is not None:
+            latest = self.server.ring_buffer.get_latest(collector.table_name)
+
+        if latest is None:
+            self.send_json({'error': 'no recent sample'}, 404)
+            return
+
+        created_at, values = latest
+        self.send_json(OrderedDict((
+            ('collector', collector.table_name),
+            ('timestamp', created_at),
+            ('values', values),
+        )))
+
+    def get_metrics(self, query):
+        """
+        Current status of all collectors for Prometheus, read only from ring
+        buffer, so scraping never queries database
+        """
+        lines = []
+
+        if self.server.ring_buffer is not None:
+            for collector in self.worker.collectors:
+                latest = self.server.ring_buffer.get_latest(
+                    collector.table_name,
+                )
+                if latest is None:
+                    continue
+
+                lines.extend(format_metrics(
+                    collector, latest[0], collector.current_status(latest),
+                ))
+
+        self.send_body(''.join(lines), CONTENT_TYPE)
+
+    def get_stats(self, query):
+        """
+        Stats of data server and the latest ones dumped by daemon
+        """
+        daemon_stats = None
+        if getattr(config, 'STATS_PATH', None):
+            try:
+                with open(config.STATS_PATH) as stats_file:
+                    daemon_stats = json.load(
+                        stats_file, object_pairs_hook=OrderedDict,
+                    )
+            except (IOError, ValueError):
+                pass
+
+        self.send_json(OrderedDict((
+            ('data_server', stats.snapshot()),
+            ('daemon', daemon_stats),
+        )))
+
+    def get_series(self, query):
+        """
+        Series of one collector as columnar JSON
+
+        Parameters: collector (name from config or table name), from and to
+        (unix timestamps, default is last day), step (seconds, default 60)
+        and agg (avg, min or max, default avg).
+        """
+        collector = self.worker.collectors_by_name.get(
+            query.get('collector', [None])[0]
+        )
+        if collector is None:
+            self.send_json({'error': 'unknown collector'}, 400)
+            return
+
+        try:
+            end = int(query.get('to', [time.time()])[0])
+            start = int(query.get('from', [end - 24 * 60 * 60])[0])
+            step = int(query.get('step', [60])[0])
+        except ValueError:
+            self.send_json({'error': 'from, to and step must be numbers'}, 400)
+            return
+
+        aggregate = query.get('agg', ['avg'])[0]
+        if aggregate not in SERIES_AGGREGATES:
+            self.send_json({'error': 'agg must be avg, min or max'}, 400)
+            return
+
+        if step <= 0 or end <= start:
+            self.send_json({'error': 'step and range must be positive'}, 400)
+            return
+
+        if (end - start) // step > MAX_SERIES_POINTS:
+            self.send_json({
+                'error': 'at most %i points can be returned, use larger step'
+                         % MAX_SERIES_POINTS,
+            }, 400)
+            return
+
+        # steps shorter than finest bucket are read from raw rows only
+        raw_days = (collector.retention or {}).get(
+            'raw', RETENTION_POLICY['raw'],
+        )
+        if (rollup.choose_series_tier(step) is None and
+                raw_days is not None and
+                start < time.time() - raw_days * 24 * 60 * 60):
+            self.send_json({
+                'error': 'steps under %i seconds are kept for %s days only'
+                         % (rollup.TIERS[0] * 60, raw_days),
+            }, 400)
+            return
+
+        # recent ranges are answered from ring buffer, when it reaches back
+        series = None
+        if self.server.ring_buffer is not None:
+            series = self.server.ring_buffer.get_series(
+                collector.table_name, start, end, step, aggregate,
+            )
+        if series is None:
+            series = collector.get_series(start, end, step, aggregate)
+
+        source, timestamps, columns = series
+
+        self.send_stream(json_iterdumps(OrderedDict((
+            ('collector', collector.table_name),
+            ('from', start),
+            ('to', end),
+            ('step', step),
+            ('agg', aggregate),
+            ('source', source),
+            ('timestamp', timestamps),
+            ('columns', columns),
+        ))), 'application/json')
+
+
+class IdleConnections(object):
+    """
+    Kept alive connections waiting for next request, polled by single
+    thread. Connection is queued for workers once it becomes readable, and
+    closed when it stays idle for timeout.
+    """
+
+    def __init__(self, server, timeout=15):
+        """
+        :type server: ChartServer
+        :param timeout: Seconds idle connection is kept open
+        :type timeout: float
+        """
+        self.server = server
+        self.timeout = timeout
+        # connections handed over by workers, registered by polling thread
+        self.added = []
+        self.lock = threading.Lock()
+        # wakes up polling thread when connection is added
+        self.wakeup_read, self.wakeup_write = os.pipe()
+
+    def start(self):
+        thread = threading.Thread(target=self.run, name='janitor-idle')
+        thread.daemon = True
+        thread.start()
+
+    def add(self, request, client_address):
+        with self.lock:
+            self.added.append((request, client_address))
+        os.write(self.wakeup_write, '.')
+
+    def run(self):
+        poller = select.poll()
+        poller.register(self.wakeup_read, select.POLLIN)
+        # file descriptor: socket, client address, monotonic time of the
+        # last request
+        connections = {}
+
+        while True:
+            with self.lock:
+                added, self.added = self.added, []
+
+            for request, client_address in added:
+                poller.register(request, select.POLLIN)
+                connections[request.fileno()] = (
+                    request, client_address, monotonic(),
+                )
+
+            timeout = None
+            if connections:
+                oldest = min(since for _, _, since in connections.values())
+                timeout = max(oldest + self.timeout - monotonic(), 0) * 1000
+
+            for fd, _ in poller.poll(timeout):
+                if fd == self.wakeup_read:
+                    os.read(self.wakeup_read, 4096)
+                    continue
+
+                # closed connection is readable too, worker finds it out
+                request, client_address, _ = connections.pop(fd)
+                poller.unregister(fd)
+                self.server.requests.put((request, client_address))
+
+            now = monotonic()
+            for fd, (request, _, since) in connections.items():
+                if now - since >= self.timeout:
+                    del connections[fd]
+                    poller.unregister(fd)
+                    self.server.shutdown_request(request)
+
+
+class ChartServer(BaseHTTPServer.HTTPServer):
+    """
+    HTTP server passing accepted connections to pool of worker threads
+    """
+    allow_reuse_address = True
+
+    def __init__(self, server_address, handler_class, threads=8):
+        BaseHTTPServer.HTTPServer.__init__(
+            self, server_address, handler_class,
+        )
+        self.local = threading.local()
+        self.cache = DataCache(getattr(config, 'JANITOR_DATA_CACHE_SIZE', 32))
+        # the latest rendered dashboard, shared by all workers
+        self.page = None
+        self.events = EventBroadcaster(
+            Worker, self.cache, CHART_LIMIT, CHART_INTERVAL,
+            getattr(config, 'JANITOR_DATA_EVENTS_INTERVAL', 5),
+        )
+        self.events.start()
+
+        self.ring_buffer = None
+        if getattr(config, 'RING_BUFFER_PATH', None):
+            self.ring_buffer = RingBuffer(config.RING_BUFFER_PATH)
+        self.requests = Queue.Queue()
+        self.idle = IdleConnections(
+            self, getattr(config, 'JANITOR_DATA_KEEP_ALIVE', 15),
+        )
+        self.idle.start()
+
+        for _ in xrange(threads):
+            thread = threading.Thread(target=self.process_requests)
+            thread.daemon = True
+            thread.start()
+
+    def process_requests(self):
+        """
+        Loop of worker thread
+        """
+        self.local.worker = Worker()
+
+        while True:
+            request, client_address = self.requests.get()
+
+            handler = None
+            try:
+                handler = self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                if handler is None or not handler.detached:
+                    self.shutdown_request(request)
+
+    def finish_request(self, request, client_address):
+        return self.RequestHandlerClass(request, client_address, self)
+
+    def process_request(self, request, client_address):
+        self.requests.put((request, client_address))
+
+    def handle_error(self, request, client_address):
+        # clients closing kept alive connections are not errors
+        if not isinstance(sys.exc_info()[1], socket.error):
+            BaseHTTPServer.HTTPServer.handle_error(
+                self, request, client_address,
+            )
+
+
+def run():
+    server = ChartServer(
+        config.JANITOR_DATA_BIND_TO,
+        ChartHandler,
+        getattr(config, 'JANITOR_DATA_THREADS', 8),
+    )
+
+    server.serve_forever()
@@ -0,0 +1,6 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+from janitor.synthetic import main
+
+if __name__ == '__main__':
+    main()